@@ -4,26 +4,1350 @@ import numpy as np
 from datetime import datetime
 import json
 import os
+import re
+import atexit
+import base64
+import contextlib
 import hashlib
+import socket
+import sqlite3
+import sys
 import threading
 import time
-from datetime import datetime
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+DEFAULT_INFERENCE_RULES = [
+    {
+        'id': 'R01',
+        'name': 'Deteksi Pola Infeksi',
+        'conditions': ['G01', 'G03', 'G07'], 
+        'conclusion': 'INFECTION_PATTERN',
+        'cf': 0.8,
+        'target_disease': 'P02', 
+        'description': 'Pola gejala menunjukkan kemungkinan infeksi telinga'
+    },
+
+    {
+        'id': 'R02',
+        'name': 'Deteksi Pola Sumbatan',
+        'conditions': ['G11', 'G12', 'G10'],
+        'conclusion': 'BLOCKAGE_PATTERN',
+        'cf': 0.7,
+        'target_disease': 'P03',
+        'description': 'Pola gejala menunjukkan kemungkinan sumbatan telinga'
+    },
+
+    {
+        'id': 'R03', 
+        'name': 'Deteksi Pola Vertigo',
+        'conditions': ['G9', 'G10', 'G5'],  
+        'conclusion': 'VERTIGO_PATTERN',
+        'cf': 0.9,
+        'target_disease': 'P05', 
+        'description': 'Pola gejala menunjukkan kemungkinan gangguan keseimbangan'
+    },
+
+    {
+        'id': 'R04',
+        'name': 'Deteksi Infeksi Eksternal',
+        'conditions': ['G02', 'G04', 'G05'], 
+        'conclusion': 'EXTERNAL_INFECTION_PATTERN', 
+        'cf': 0.75,
+        'target_disease': 'P01', 
+        'description': 'Pola gejala menunjukkan kemungkinan infeksi telinga luar'
+    },
+
+    {
+        'id': 'R05',
+        'name': 'Deteksi Pola Tinnitus',
+        'conditions': ['G15', 'G17'], 
+        'conclusion': 'TINNITUS_PATTERN',
+        'cf': 0.8,
+        'target_disease': 'P04', 
+        'description': 'Pola gejala menunjukkan kemungkinan tinnitus'
+    },
+
+    {
+        'id': 'R06',
+        'name': 'Deteksi Pola Tekanan',
+        'conditions': ['G06', 'G13'], 
+        'conclusion': 'PRESSURE_PATTERN',
+        'cf': 0.6,
+        'target_disease': 'P06', 
+        'description': 'Pola gejala menunjukkan kemungkinan trauma tekanan'
+    },
+
+    {
+        'id': 'R07',
+        'name': 'Infeksi Kompleks',
+        'conditions': ['INFECTION_PATTERN', 'G04'], 
+        'conclusion': 'COMPLEX_INFECTION',
+        'cf': 0.9,
+        'target_disease': 'P02',
+        'description': 'Infeksi dengan komplikasi'
+    }
+]
+
+DEFAULT_SEVERITY_MULTIPLIERS = {
+    "tidak_parah": 0.3,
+    "lumayan_parah": 0.6,
+    "parah": 0.85,
+    "sangat_parah": 1.0
+}
+
+# Tata letak form konsultasi: (judul kelompok, kode gejala)
+DEFAULT_SYMPTOM_GROUPS = [
+    ("🔥 Gejala Nyeri & Sensitivitas", ['G01', 'G02', 'G05', 'G06']),
+    ("👂 Masalah Pendengaran & Telinga", ['G08', 'G09', 'G11', 'G12']),
+    ("💧 Cairan & Infeksi", ['G03', 'G04', 'G07']),
+    ("⚖️ Keseimbangan & Sistem", ['G10'])
+]
+
+# Mengaktifkan radio keparahan hanya untuk gejala yang dicentang, sepenuhnya di browser
+FORM_TOGGLE_JS = """
+() => {
+    const sync = () => {
+        document.querySelectorAll('[id^="symptom-"]').forEach((box) => {
+            const checkbox = box.querySelector('input[type=checkbox]');
+            const code = box.id.slice('symptom-'.length);
+            document.querySelectorAll(`#severity-${code} input[type=radio]`).forEach((radio) => {
+                radio.disabled = !(checkbox && checkbox.checked);
+            });
+        });
+    };
+    document.addEventListener('change', (event) => {
+        if (event.target.closest('[id^="symptom-"]')) sync();
+    });
+    // Form dirender ulang saat knowledge base diganti; sinkronkan sekali per frame
+    let pending = false;
+    new MutationObserver(() => {
+        if (pending) return;
+        pending = true;
+        requestAnimationFrame(() => { pending = false; sync(); });
+    }).observe(document.body, {childList: true, subtree: true});
+    window.earFormSync = sync;
+    sync();
+}
+"""
+
+# Reset form di browser: keparahan kembali ke tidak_parah lalu semua gejala dilepas
+FORM_RESET_JS = """
+(...args) => {
+    document.querySelectorAll('[id^="severity-"] input[type=radio][value="tidak_parah"]').forEach((radio) => {
+        radio.disabled = false;
+        if (!radio.checked) radio.click();
+    });
+    document.querySelectorAll('[id^="symptom-"] input[type=checkbox]').forEach((checkbox) => {
+        if (checkbox.checked) checkbox.click();
+    });
+    if (window.earFormSync) window.earFormSync();
+    return args;
+}
+"""
+
+# Mengumpulkan gejala terpilih menjadi satu payload JSON {"G01": "parah", ...}
+FORM_PAYLOAD_JS = """
+(...args) => {
+    const payload = {};
+    document.querySelectorAll('[id^="symptom-"]').forEach((box) => {
+        const checkbox = box.querySelector('input[type=checkbox]');
+        if (!checkbox || !checkbox.checked) return;
+        const code = box.id.slice('symptom-'.length);
+        const severity = document.querySelector(`#severity-${code} input[type=radio]:checked`);
+        payload[code] = severity ? severity.value : 'tidak_parah';
+    });
+    args[args.length - 1] = JSON.stringify(payload);
+    return args;
+}
+"""
+
+# Sinonim / istilah sehari-hari untuk pencarian gejala dari teks bebas
+DEFAULT_SYMPTOM_SYNONYMS = {
+    'G01': ['telinga gatal', 'gatal di dalam telinga'],
+    'G02': ['telinga sakit kalau dipegang', 'nyeri saat daun telinga ditarik'],
+    'G03': ['keluar air dari telinga', 'telinga berair'],
+    'G04': ['congek', 'keluar nanah dari telinga', 'cairan telinga bau', 'keluar cairan berbau'],
+    'G05': ['budek', 'tuli', 'kurang dengar', 'susah mendengar', 'pendengaran berkurang'],
+    'G06': ['telinga buntu', 'telinga tertutup', 'telinga mampet'],
+    'G07': ['panas', 'meriang', 'badan panas', 'suhu tinggi'],
+    'G08': ['bengkak di leher', 'benjolan di belakang telinga', 'kelenjar bengkak'],
+    'G09': ['kepala berputar', 'pusing berputar', 'sempoyongan', 'hilang keseimbangan'],
+    'G10': ['telinga berdengung', 'tinnitus', 'bunyi di telinga', 'telinga berbunyi'],
+    'G11': ['sakit telinga', 'telinga nyeri', 'telinga sakit'],
+    'G12': ['demam dan pilek', 'flu', 'pilek disertai panas']
+}
+
+# Kalimat uji teks bebas knowledge base telinga: (teks, gejala terpilih, gejala yang dikecualikan)
+FREE_TEXT_REGRESSION_CASES = [
+    ("tanpa demam", set(), {'G07'}),
+    ("nggak demam", set(), {'G07'}),
+    ("tidak ada cairan keluar", set(), {'G04'}),
+    ("saya tidak pusing, telinga berdenging", {'G10'}, {'G09'}),
+    ("telinga sakit tanpa demam", {'G11'}, {'G07'}),
+    ("demam dan pilek", {'G12'}, set())
+]
+
+# Kebijakan persistensi statistik beserta jendela kehilangan data saat proses/mesin mati mendadak
+DURABILITY_MODES = {
+    'none': "Tidak menulis di jalur request; hanya flush saat shutdown normal. Crash = kehilangan semua konsultasi sejak start/flush terakhir.",
+    'periodic': "Tulis (tanpa fsync) paling sering tiap save_interval detik di jalur request. Crash proses = hilang <= save_interval detik; mati listrik = bisa lebih, tergantung page cache OS.",
+    'group-commit': "Konsultasi dikumpulkan selama group_commit_delay lalu ditulis + fsync sekali oleh thread latar; request menunggu sampai batch-nya durable. Konsultasi yang sudah dijawab tidak pernah hilang; bila disk gagal lebih dari group_commit_timeout detik, request dijawab dengan peringatan."
+}
+
+
+class FrozenSlots:
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} tidak dapat diubah")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} tidak dapat diubah")
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+# Penulisan atribut hanya lewat konstruktor; tanpa dict kwargs agar tidak ada alokasi tambahan
+_set_slot = object.__setattr__
+
+
+class Symptom(FrozenSlots):
+    __slots__ = ('code', 'description')
+
+    def __init__(self, code, description):
+        _set_slot(self, 'code', sys.intern(code))
+        _set_slot(self, 'description', description)
+
+
+class Disease(FrozenSlots):
+    __slots__ = ('code', 'name', 'info', 'solution', 'severity', 'duration', 'symptoms')
+
+    def __init__(self, code, name, info, solution, severity, duration, symptoms):
+        _set_slot(self, 'code', sys.intern(code))
+        _set_slot(self, 'name', name)
+        _set_slot(self, 'info', info)
+        _set_slot(self, 'solution', solution)
+        _set_slot(self, 'severity', severity)
+        _set_slot(self, 'duration', duration)
+        # Pasangan (kode gejala, CF) dalam urutan knowledge base
+        _set_slot(self, 'symptoms', tuple((sys.intern(symptom_code), float(base_cf)) for symptom_code, base_cf in symptoms.items()))
+
+    @classmethod
+    def from_dict(cls, code, disease):
+        return cls(
+            code, disease['name'], disease['info'], disease['solution'],
+            disease.get('severity', 'Tidak diketahui'), disease.get('duration', 'Bervariasi'),
+            disease['symptoms']
+        )
+
+
+class Rule(FrozenSlots):
+    __slots__ = ('id', 'name', 'conditions', 'conclusion', 'cf', 'target_disease', 'description')
+
+    def __init__(self, id, name, conditions, conclusion, cf, target_disease, description):
+        _set_slot(self, 'id', sys.intern(id))
+        _set_slot(self, 'name', name)
+        _set_slot(self, 'conditions', tuple(sys.intern(condition) for condition in conditions))
+        _set_slot(self, 'conclusion', sys.intern(conclusion))
+        _set_slot(self, 'cf', float(cf))
+        _set_slot(self, 'target_disease', sys.intern(target_disease) if target_disease else None)
+        _set_slot(self, 'description', description)
+
+    @classmethod
+    def from_dict(cls, rule):
+        return cls(
+            rule['id'], rule['name'], rule['conditions'], rule['conclusion'],
+            rule['cf'], rule.get('target_disease'), rule.get('description', '')
+        )
+
+
+class DiagnosisResult(FrozenSlots):
+    __slots__ = ('disease', 'matching_symptoms', 'confidence', 'match_ratio', 'fired_rules', 'risk_level')
+
+    def __init__(self, disease, matching_symptoms, confidence, match_ratio, fired_rules, risk_level):
+        _set_slot(self, 'disease', disease)
+        _set_slot(self, 'matching_symptoms', matching_symptoms)
+        _set_slot(self, 'confidence', confidence)
+        _set_slot(self, 'match_ratio', match_ratio)
+        _set_slot(self, 'fired_rules', fired_rules)
+        _set_slot(self, 'risk_level', risk_level)
+
+    code = property(lambda self: self.disease.code)
+    name = property(lambda self: self.disease.name)
+    info = property(lambda self: self.disease.info)
+    solution = property(lambda self: self.disease.solution)
+    severity = property(lambda self: self.disease.severity)
+    duration = property(lambda self: self.disease.duration)
+    total_symptoms = property(lambda self: len(self.disease.symptoms))
+    matched_count = property(lambda self: len(self.matching_symptoms))
+
+
+class ConsultationRollups:
+    # Format kunci bucket dapat diurutkan secara leksikografis = kronologis
+    key_formats = {
+        'minute': '%Y-%m-%dT%H:%M',
+        'hour': '%Y-%m-%dT%H',
+        'day': '%Y-%m-%d',
+        'month': '%Y-%m'
+    }
+
+    # Bucket yang lebih tua dari retensi ini dibuang; data tetap ada di level yang lebih kasar
+    retention = {
+        'minute': timedelta(hours=24),
+        'hour': timedelta(days=30),
+        'day': timedelta(days=730),
+        'month': None
+    }
+
+    # Level dan jendela yang dibagikan antar replika: yang ditampilkan di tren (24 jam per jam, 7 hari per hari)
+    shared_windows = {
+        'hour': timedelta(hours=24),
+        'day': timedelta(days=7)
+    }
+
+    def __init__(self, data=None):
+        self.buckets = {granularity: {} for granularity in self.key_formats}
+        self.last_compaction = None
+        if isinstance(data, dict):
+            for granularity in self.key_formats:
+                if isinstance(data.get(granularity), dict):
+                    self.buckets[granularity] = data[granularity]
+
+    def to_dict(self):
+        return {
+            granularity: {key: self.copy_bucket(bucket) for key, bucket in buckets.items()}
+            for granularity, buckets in self.buckets.items()
+        }
+
+    @staticmethod
+    def copy_bucket(bucket):
+        return {field: dict(value) if isinstance(value, dict) else value for field, value in bucket.items()}
+
+    @staticmethod
+    def merge_bucket(target, bucket, combine):
+        target['count'] = combine(target['count'], bucket.get('count', 0))
+        for field in ('diagnoses', 'symptoms', 'severities'):
+            for name, count in bucket.get(field, {}).items():
+                target[field][name] = combine(target[field].get(name, 0), count)
+
+    def shared(self, now):
+        shared = {}
+        for granularity, window in self.shared_windows.items():
+            cutoff = (now - window).strftime(self.key_formats[granularity])
+            shared[granularity] = {
+                key: self.copy_bucket(bucket) for key, bucket in self.buckets[granularity].items() if key >= cutoff
+            }
+        return shared
+
+    def add(self, buckets):
+        # Menjumlahkan bucket replika lain ke rollup ini (dipakai pada salinan untuk tampilan global)
+        for granularity, incoming in buckets.items():
+            for key, bucket in incoming.items():
+                target = self.buckets[granularity].setdefault(key, {'count': 0, 'diagnoses': {}, 'symptoms': {}, 'severities': {}})
+                self.merge_bucket(target, bucket, lambda a, b: a + b)
+
+    @classmethod
+    def join(cls, current, incoming, now):
+        # Bucket satu node hanya bertambah, jadi gabungan dua salinannya = maksimum per field; bucket di luar jendela dibuang
+        joined = {}
+        for granularity, window in cls.shared_windows.items():
+            cutoff = (now - window).strftime(cls.key_formats[granularity])
+            buckets = {}
+            for source in (current or {}, incoming or {}):
+                for key, bucket in source.get(granularity, {}).items():
+                    if key >= cutoff:
+                        target = buckets.setdefault(key, {'count': 0, 'diagnoses': {}, 'symptoms': {}, 'severities': {}})
+                        cls.merge_bucket(target, bucket, max)
+            joined[granularity] = buckets
+        return joined
+
+    def record(self, timestamp, disease_name, selected_symptoms):
+        for granularity, key_format in self.key_formats.items():
+            key = timestamp.strftime(key_format)
+            bucket = self.buckets[granularity].get(key)
+            if bucket is None:
+                bucket = {'count': 0, 'diagnoses': {}, 'symptoms': {}, 'severities': {}}
+                self.buckets[granularity][key] = bucket
+
+            bucket['count'] += 1
+            if disease_name:
+                bucket['diagnoses'][disease_name] = bucket['diagnoses'].get(disease_name, 0) + 1
+            for code, severity in selected_symptoms.items():
+                bucket['symptoms'][code] = bucket['symptoms'].get(code, 0) + 1
+                bucket['severities'][severity] = bucket['severities'].get(severity, 0) + 1
+
+        minute_key = timestamp.strftime(self.key_formats['minute'])
+        if minute_key != self.last_compaction:
+            self.compact(timestamp)
+            self.last_compaction = minute_key
+
+    def compact(self, now):
+        for granularity, max_age in self.retention.items():
+            if max_age is None:
+                continue
+            cutoff = (now - max_age).strftime(self.key_formats[granularity])
+            buckets = self.buckets[granularity]
+            for key in [key for key in buckets if key < cutoff]:
+                del buckets[key]
+
+    def bucket_starts(self, granularity, start, end):
+        if granularity == 'month':
+            current = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            while current <= end:
+                yield current
+                if current.month == 12:
+                    current = current.replace(year=current.year + 1, month=1)
+                else:
+                    current = current.replace(month=current.month + 1)
+            return
+
+        steps = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+        current = datetime.strptime(start.strftime(self.key_formats[granularity]), self.key_formats[granularity])
+        while current <= end:
+            yield current
+            current += steps[granularity]
+
+    def series(self, granularity, start, end, field='count', key=None):
+        buckets = self.buckets[granularity]
+        key_format = self.key_formats[granularity]
+        points = []
+        for bucket_start in self.bucket_starts(granularity, start, end):
+            bucket = buckets.get(bucket_start.strftime(key_format))
+            if bucket is None:
+                value = 0
+            elif field == 'count':
+                value = bucket['count']
+            elif key is None:
+                value = dict(bucket[field])
+            else:
+                value = bucket[field].get(key, 0)
+            points.append((bucket_start, value))
+        return points
+
+    def totals(self, granularity, start, end, field):
+        totals = {}
+        start_key = start.strftime(self.key_formats[granularity])
+        end_key = end.strftime(self.key_formats[granularity])
+        for bucket_key, bucket in self.buckets[granularity].items():
+            if start_key <= bucket_key <= end_key:
+                for name, count in bucket[field].items():
+                    totals[name] = totals.get(name, 0) + count
+        return totals
+
+
+class HeavyHitterSketch:
+    # Count-min sketch (memori tetap) + daftar kandidat teratas berukuran tetap
+    def __init__(self, width=2048, depth=4, capacity=32, data=None):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.top = {}
+        if isinstance(data, dict):
+            self.width = int(data.get('width', width))
+            self.depth = int(data.get('depth', depth))
+            self.capacity = int(data.get('capacity', capacity))
+            self.total = int(data.get('total', 0))
+            self.table = np.frombuffer(
+                zlib.decompress(base64.b64decode(data['table'])), dtype='<i8'
+            ).reshape(self.depth, self.width).copy()
+            self.top = {key: int(count) for key, count in data.get('top', {}).items()}
+
+    def to_dict(self):
+        return {
+            'width': self.width,
+            'depth': self.depth,
+            'capacity': self.capacity,
+            'total': self.total,
+            'table': base64.b64encode(zlib.compress(self.table.astype('<i8').tobytes())).decode('ascii'),
+            'top': dict(self.top)
+        }
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8 * self.depth).digest()
+        return np.frombuffer(digest, dtype='<u8') % self.width
+
+    def add(self, key, count=1):
+        columns = self.positions(key)
+        rows = np.arange(self.depth)
+        self.table[rows, columns] += count
+        self.total += count
+        estimate = int(self.table[rows, columns].min())
+
+        if key in self.top or len(self.top) < self.capacity:
+            self.top[key] = estimate
+            return
+        # Ganti kandidat terkecil bila kunci baru sudah lebih sering
+        weakest = min(self.top, key=self.top.get)
+        if estimate > self.top[weakest]:
+            del self.top[weakest]
+            self.top[key] = estimate
+
+    def estimate(self, key):
+        return int(self.table[np.arange(self.depth), self.positions(key)].min())
+
+    def most_common(self, n=10):
+        return sorted(self.top.items(), key=lambda x: (-x[1], x[0]))[:n]
+
+    def merge(self, other, combine=np.add):
+        # Count-min bersifat linear: jumlah tabel = sketch gabungan semua aliran; maksimum = salinan terbaru satu aliran
+        if (other.width, other.depth) != (self.width, self.depth):
+            return False
+        self.table = combine(self.table, other.table)
+        self.total = int(combine(self.total, other.total))
+        estimates = {key: self.estimate(key) for key in set(self.top) | set(other.top)}
+        self.top = dict(sorted(estimates.items(), key=lambda x: (-x[1], x[0]))[:self.capacity])
+        return True
+
+
+class SymptomSketches:
+    # Kombinasi gejala+keparahan dan pasangan gejala yang muncul bersama, tanpa menyimpan setiap kombinasi
+    def __init__(self, data=None):
+        data = data if isinstance(data, dict) else {}
+        self.combinations = HeavyHitterSketch(data=data.get('combinations'))
+        self.cooccurrence = HeavyHitterSketch(data=data.get('cooccurrence'))
+
+    def to_dict(self):
+        return {
+            'combinations': self.combinations.to_dict(),
+            'cooccurrence': self.cooccurrence.to_dict()
+        }
+
+    def merge(self, other, combine=np.add):
+        self.combinations.merge(other.combinations, combine)
+        self.cooccurrence.merge(other.cooccurrence, combine)
+
+    @staticmethod
+    def combination_key(selected_symptoms):
+        return ",".join(f"{code}={selected_symptoms[code]}" for code in sorted(selected_symptoms))
+
+    @staticmethod
+    def parse_combination_key(key):
+        return dict(part.split("=", 1) for part in key.split(",") if "=" in part)
+
+    def record(self, selected_symptoms):
+        if not selected_symptoms:
+            return
+        self.combinations.add(self.combination_key(selected_symptoms))
+        codes = sorted(selected_symptoms)
+        for i, first in enumerate(codes):
+            for second in codes[i + 1:]:
+                self.cooccurrence.add(f"{first}+{second}")
+
+
+class SymptomTextIndex:
+    # Indeks terbalik n-gram karakter + token atas deskripsi gejala dan sinonimnya
+    stopwords = {
+        'pada', 'atau', 'dan', 'saat', 'di', 'yang', 'terutama', 'disertai', 'sekitar', 'dengan',
+        'saya', 'aku', 'sering', 'rasanya', 'terasa', 'ada', 'juga', 'sudah', 'sejak', 'hari', 'ini'
+    }
+    # Kata penguat -> tingkat keparahan (dicek dari yang paling berat)
+    severity_words = [
+        ('sangat_parah', {'sangat', 'sekali', 'banget', 'amat', 'hebat'}),
+        ('parah', {'parah', 'berat', 'kuat'}),
+        ('lumayan_parah', {'lumayan', 'cukup'}),
+        ('tidak_parah', {'sedikit', 'agak', 'ringan', 'kadang'})
+    ]
+    clause_separators = re.compile(r"[,;.\n]+")
+    conjunctions = re.compile(r"\b(dan|serta|juga|lalu|plus)\b")
+    # Penyangkal berlaku dari posisinya sampai akhir klausa ("telinga sakit tanpa demam")
+    negations = re.compile(r"\b(tidak ada|tidak|tak|nggak|enggak|ngga|gak|ga|bukan|tanpa)\b")
+
+    def __init__(self, symptoms, synonyms=None, n=3):
+        self.n = n
+        self.entry_codes = []
+        entry_grams = []
+        for code, description in symptoms.items():
+            for phrase in [description] + list((synonyms or {}).get(code, [])):
+                grams = self.features(phrase)
+                if grams:
+                    self.entry_codes.append(code)
+                    entry_grams.append(grams)
+
+        postings = {}
+        for entry, grams in enumerate(entry_grams):
+            for gram in grams:
+                postings.setdefault(gram, []).append(entry)
+
+        entries = max(len(entry_grams), 1)
+        self.idf = {gram: float(np.log(1.0 + entries / len(ids))) for gram, ids in postings.items()}
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.entry_norms = np.array(
+            [np.sqrt(sum(self.idf[gram] ** 2 for gram in grams)) for grams in entry_grams] or [1.0]
+        )
+        self.entry_codes = np.array(self.entry_codes)
+
+    @classmethod
+    def tokens(cls, text):
+        words = re.findall(r"[a-z0-9]+", text.lower().replace('kuping', 'telinga'))
+        return [word for word in words if word not in cls.stopwords]
+
+    def features(self, text):
+        features = set()
+        for token in self.tokens(text):
+            features.add('w:' + token)
+            padded = f" {token} "
+            for i in range(len(padded) - self.n + 1):
+                features.add(padded[i:i + self.n])
+        return features
+
+    def search(self, text, limit=5, min_score=0.25):
+        features = self.features(text)
+        grams = [gram for gram in features if gram in self.postings]
+        if not grams:
+            return []
+
+        scores = np.zeros(len(self.entry_norms))
+        query_norm = 0.0
+        for gram in grams:
+            weight = self.idf[gram]
+            scores[self.postings[gram]] += weight * weight
+            query_norm += weight * weight
+        # Cosine berbobot idf; n-gram query yang tidak ada di indeks tetap dihitung sebagai pembeda
+        scores /= self.entry_norms * np.sqrt(query_norm + len(features) - len(grams))
+
+        # Beberapa frasa bisa milik gejala yang sama, jadi ambil kandidat lebih banyak sebelum deduplikasi
+        shortlist = min(len(scores), limit * 4)
+        top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        matches = []
+        seen = set()
+        for entry in top[np.argsort(-scores[top], kind='stable')]:
+            score = scores[entry]
+            if score < min_score or len(matches) >= limit:
+                break
+            code = str(self.entry_codes[entry])
+            if code not in seen:
+                seen.add(code)
+                matches.append((code, round(float(score), 3)))
+        return matches
+
+    def detect_severity(self, text, default='lumayan_parah'):
+        words = set(re.findall(r"[a-z]+", text.lower()))
+        for severity, markers in self.severity_words:
+            if words & markers:
+                return severity
+        return default
+
+    def best_score(self, text):
+        matches = self.search(text, limit=1, min_score=0.0) if text.strip() else []
+        return matches[0][1] if matches else 0.0
+
+    def split_clauses(self, text, min_score):
+        # Tanda baca selalu memisah; kata sambung hanya memisah bila gabungannya tidak lebih cocok
+        # daripada bagian-bagiannya (mis. sinonim "demam dan pilek" tetap satu klausa)
+        clauses = []
+        for segment in self.clause_separators.split(text.lower()):
+            pieces = self.conjunctions.split(segment)
+            current = pieces[0]
+            for conjunction, part in zip(pieces[1::2], pieces[2::2]):
+                merged = f"{current}{conjunction}{part}"
+                if self.best_score(merged) >= max(min_score, self.best_score(current), self.best_score(part)):
+                    current = merged
+                else:
+                    clauses.append(current)
+                    current = part
+            clauses.append(current)
+        return clauses
+
+    def parse_free_text(self, text, min_score=0.35):
+        # Setiap klausa ("..., ... dan ...") dipetakan ke gejala terbaiknya; gejala yang disangkal dikecualikan
+        selected_symptoms = {}
+        candidates = []
+        excluded = []
+        for clause in self.split_clauses(text, min_score):
+            if not clause or not clause.strip():
+                continue
+            negation = self.negations.search(clause)
+            if negation is None:
+                parts = [(clause, False)]
+            else:
+                parts = [(clause[:negation.start()], False), (clause[negation.end():], True)]
+            for part, negated in parts:
+                matches = self.search(part, limit=3, min_score=0.25) if part.strip() else []
+                if not matches:
+                    continue
+                code, score = matches[0]
+                if negated:
+                    if score >= min_score:
+                        excluded.append((clause.strip(), code, score))
+                    continue
+                candidates.append((part.strip(), matches))
+                if score >= min_score and code not in selected_symptoms:
+                    selected_symptoms[code] = self.detect_severity(part)
+        return selected_symptoms, candidates, excluded
+
+
+class StatsBackend:
+    # Backend default: satu replika, tidak ada statistik replika lain untuk digabung
+    def publish(self, node_id, state):
+        pass
+
+    def fetch(self):
+        return {}
+
+    @staticmethod
+    def parse(state):
+        # State JSON dari backend -> bentuk tampilan replika; replika versi lama belum membagikan rollup/sketch
+        return {
+            'consultation_count': int(state.get('consultation_count', 0)),
+            'disease_stats': dict(state.get('disease_stats', {})),
+            'rollups': state.get('rollups', {}),
+            'sketches': SymptomSketches(state.get('sketches'))
+        }
+
+    @staticmethod
+    def join(current, incoming, now):
+        # G-counter: setiap node hanya menaikkan hitungannya sendiri, jadi gabungan = maksimum per node
+        if not current:
+            current = {'consultation_count': 0, 'disease_stats': {}, 'rollups': {}, 'sketches': SymptomSketches()}
+        disease_stats = dict(current['disease_stats'])
+        for name, count in incoming['disease_stats'].items():
+            disease_stats[name] = max(disease_stats.get(name, 0), count)
+        sketches = SymptomSketches()
+        sketches.merge(current['sketches'], np.maximum)
+        sketches.merge(incoming['sketches'], np.maximum)
+        return {
+            'consultation_count': max(current['consultation_count'], incoming['consultation_count']),
+            'disease_stats': disease_stats,
+            'rollups': ConsultationRollups.join(current['rollups'], incoming['rollups'], now),
+            'sketches': sketches
+        }
+
+
+class SharedDirectoryStatsBackend(StatsBackend):
+    # Satu file per node di direktori bersama (NFS, volume bersama); tiap file hanya ditulis pemiliknya
+    def __init__(self, directory, namespace=''):
+        self.directory = os.path.join(directory, namespace) if namespace else directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def publish(self, node_id, state):
+        path = os.path.join(self.directory, f"{node_id}.json")
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_file, path)
+
+    def fetch(self):
+        states = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    states[name[:-len('.json')]] = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"ERROR reading replica stats {name}: {e}")
+        return states
+
+
+class SQLiteStatsBackend(StatsBackend):
+    # Pengganti key-value store lokal: satu baris per node
+    def __init__(self, path, namespace=''):
+        self.path = path
+        # Nama knowledge base sudah divalidasi (huruf kecil, angka, garis bawah) sehingga aman sebagai nama tabel
+        self.table = f"replica_stats_{namespace}" if namespace else "replica_stats"
+        with sqlite3.connect(self.path, timeout=10) as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (node_id TEXT PRIMARY KEY, state TEXT NOT NULL)")
+
+    def publish(self, node_id, state):
+        with sqlite3.connect(self.path, timeout=10) as conn:
+            conn.execute(f"INSERT OR REPLACE INTO {self.table} (node_id, state) VALUES (?, ?)", (node_id, json.dumps(state, ensure_ascii=False)))
+
+    def fetch(self):
+        with sqlite3.connect(self.path, timeout=10) as conn:
+            rows = conn.execute(f"SELECT node_id, state FROM {self.table}").fetchall()
+        return {node_id: json.loads(state) for node_id, state in rows}
+
+
+STATS_BACKENDS = {
+    'local': lambda location, namespace='': StatsBackend(),
+    'shared-dir': SharedDirectoryStatsBackend,
+    'sqlite': SQLiteStatsBackend
+}
+
+
+class CompiledKnowledgeBase:
+    magic = b'EARKB\x00'
+    version = 3
+
+    # magic, versi, jumlah string/gejala/penyakit/bobot/aturan/kondisi, mtime & ukuran sumber JSON
+    header_format = '<6sH6IqQ'
+    sections = [
+        'string_offsets', 'string_blob', 'symptom_table', 'disease_table',
+        'cf_indptr', 'cf_indices', 'cf_data',
+        'rule_table', 'rule_cf', 'rule_cond_indptr', 'rule_cond_indices',
+        'severity_table', 'severity_data', 'vocabulary_json'
+    ]
+
+    disease_fields = ['code', 'name', 'info', 'solution', 'severity', 'duration']
+    rule_fields = ['id', 'name', 'conclusion', 'target_disease', 'description']
+
+    def __init__(self, path, mapped, header, arrays):
+        self.path = path
+        self.mapped = mapped
+        (_, _, self.n_strings, self.n_symptoms, self.n_diseases,
+         self.nnz, self.n_rules, _, self.source_mtime_ns, self.source_size) = header
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.string_cache = {}
+
+    @classmethod
+    def compile(cls, diseases, symptoms, rules, output_path, source_path=None, severity_multipliers=None, vocabulary=None):
+        import struct
+        import tempfile
+
+        strings = []
+        string_ids = {}
+
+        def intern(value):
+            if value is None:
+                return -1
+            value = str(value)
+            string_id = string_ids.get(value)
+            if string_id is None:
+                string_id = len(strings)
+                string_ids[value] = string_id
+                strings.append(value)
+            return string_id
+
+        symptom_codes = list(symptoms.keys())
+        symptom_index = {code: i for i, code in enumerate(symptom_codes)}
+        symptom_rows = [[intern(code), intern(desc)] for code, desc in symptoms.items()]
+
+        disease_rows = []
+        cf_indptr = [0]
+        cf_indices = []
+        cf_data = []
+        for code, disease in diseases.items():
+            disease_rows.append([intern(code)] + [intern(disease.get(field)) for field in cls.disease_fields[1:]])
+            for symptom_code, base_cf in disease.get('symptoms', {}).items():
+                if symptom_code not in symptom_index:
+                    # Gejala yang dirujuk tetapi tidak terdaftar tetap dicatat tanpa deskripsi
+                    symptom_index[symptom_code] = len(symptom_rows)
+                    symptom_rows.append([intern(symptom_code), -1])
+                cf_indices.append(symptom_index[symptom_code])
+                cf_data.append(float(base_cf))
+            cf_indptr.append(len(cf_indices))
+
+        rule_rows = []
+        rule_cf = []
+        rule_cond_indptr = [0]
+        rule_cond_indices = []
+        for rule in rules:
+            rule_rows.append([intern(rule.get(field)) for field in cls.rule_fields])
+            rule_cf.append(float(rule.get('cf', 0.0)))
+            rule_cond_indices.extend(intern(condition) for condition in rule.get('conditions', []))
+            rule_cond_indptr.append(len(rule_cond_indices))
+
+        severity_multipliers = severity_multipliers or {}
+        severity_rows = [intern(severity) for severity in severity_multipliers]
+        severity_data = [float(multiplier) for multiplier in severity_multipliers.values()]
+
+        encoded = [value.encode('utf-8') for value in strings]
+        string_offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+        if encoded:
+            string_offsets[1:] = np.cumsum([len(value) for value in encoded])
+
+        arrays = {
+            'string_offsets': string_offsets,
+            'string_blob': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'symptom_table': np.array(symptom_rows, dtype='<i4').reshape(-1, 2),
+            'disease_table': np.array(disease_rows, dtype='<i4').reshape(-1, len(cls.disease_fields)),
+            'cf_indptr': np.array(cf_indptr, dtype='<i4'),
+            'cf_indices': np.array(cf_indices, dtype='<i4'),
+            'cf_data': np.array(cf_data, dtype='<f8'),
+            'rule_table': np.array(rule_rows, dtype='<i4').reshape(-1, len(cls.rule_fields)),
+            'rule_cf': np.array(rule_cf, dtype='<f8'),
+            'rule_cond_indptr': np.array(rule_cond_indptr, dtype='<i4'),
+            'rule_cond_indices': np.array(rule_cond_indices, dtype='<i4'),
+            'severity_table': np.array(severity_rows, dtype='<i4'),
+            'severity_data': np.array(severity_data, dtype='<f8'),
+            # Sinonim dan kelompok gejala jarang dibaca per elemen, jadi cukup disimpan sebagai JSON
+            'vocabulary_json': np.frombuffer(json.dumps(vocabulary or {}, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+        }
+
+        source_mtime_ns, source_size = 0, 0
+        if source_path and os.path.exists(source_path):
+            source_stat = os.stat(source_path)
+            source_mtime_ns, source_size = source_stat.st_mtime_ns, source_stat.st_size
+
+        header = struct.pack(
+            cls.header_format, cls.magic, cls.version,
+            len(strings), len(symptom_rows), len(disease_rows), len(cf_data),
+            len(rule_rows), len(rule_cond_indices), source_mtime_ns, source_size
+        )
+
+        # Setiap section disejajarkan 8 byte agar bisa dibaca langsung sebagai array dari mmap
+        table_size = 16 * len(cls.sections)
+        offset = len(header) + table_size
+        section_table = []
+        for name in cls.sections:
+            offset += -offset % 8
+            section_table.append((offset, arrays[name].nbytes))
+            offset += arrays[name].nbytes
+
+        # Nama sementara unik: beberapa proses worker bisa mengompilasi ulang file yang sama bersamaan
+        fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.kb.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            for section_offset, section_size in section_table:
+                f.write(struct.pack('<QQ', section_offset, section_size))
+            for name, (section_offset, _) in zip(cls.sections, section_table):
+                f.write(b'\x00' * (section_offset - f.tell()))
+                f.write(arrays[name].tobytes())
+        os.replace(temp_file, output_path)
+
+        return offset
+
+    @classmethod
+    def open(cls, path):
+        import mmap
+        import struct
+
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_size = struct.calcsize(cls.header_format)
+        header = struct.unpack_from(cls.header_format, mapped, 0)
+        if header[0] != cls.magic or header[1] != cls.version:
+            mapped.close()
+            raise ValueError(f"Bukan file knowledge base terkompilasi (v{cls.version}): {path}")
+
+        dtypes = {
+            'string_offsets': '<u4', 'string_blob': np.uint8, 'symptom_table': '<i4',
+            'disease_table': '<i4', 'cf_indptr': '<i4', 'cf_indices': '<i4', 'cf_data': '<f8',
+            'rule_table': '<i4', 'rule_cf': '<f8', 'rule_cond_indptr': '<i4', 'rule_cond_indices': '<i4',
+            'severity_table': '<i4', 'severity_data': '<f8', 'vocabulary_json': np.uint8
+        }
+        arrays = {}
+        for i, name in enumerate(cls.sections):
+            section_offset, section_size = struct.unpack_from('<QQ', mapped, header_size + 16 * i)
+            dtype = np.dtype(dtypes[name])
+            arrays[name] = np.frombuffer(mapped, dtype=dtype, count=section_size // dtype.itemsize, offset=section_offset)
+
+        arrays['symptom_table'] = arrays['symptom_table'].reshape(-1, 2)
+        arrays['disease_table'] = arrays['disease_table'].reshape(-1, len(cls.disease_fields))
+        arrays['rule_table'] = arrays['rule_table'].reshape(-1, len(cls.rule_fields))
+
+        return cls(path, mapped, header, arrays)
+
+    def is_fresh(self, source_path):
+        if not os.path.exists(source_path):
+            return True
+        source_stat = os.stat(source_path)
+        return source_stat.st_mtime_ns == self.source_mtime_ns and source_stat.st_size == self.source_size
+
+    def string(self, string_id):
+        if string_id < 0:
+            return None
+        value = self.string_cache.get(string_id)
+        if value is None:
+            start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+            value = bytes(self.string_blob[start:end]).decode('utf-8')
+            self.string_cache[string_id] = value
+        return value
+
+    def symptom_codes(self):
+        return [self.string(int(code_id)) for code_id in self.symptom_table[:, 0]]
+
+    def disease_codes(self):
+        return [self.string(int(code_id)) for code_id in self.disease_table[:, 0]]
+
+    def dense_cf_matrix(self):
+        matrix = np.zeros((self.n_diseases, self.n_symptoms), dtype=np.float64)
+        rows = np.repeat(np.arange(self.n_diseases), np.diff(self.cf_indptr))
+        matrix[rows, self.cf_indices] = self.cf_data
+        return matrix
+
+    def cf_presence_matrix(self):
+        presence = np.zeros((self.n_diseases, self.n_symptoms), dtype=bool)
+        rows = np.repeat(np.arange(self.n_diseases), np.diff(self.cf_indptr))
+        presence[rows, self.cf_indices] = True
+        return presence
+
+    def decode_strings(self):
+        # Seluruh blob didekode sekali; lebih murah daripada slicing numpy per string
+        blob = self.string_blob.tobytes()
+        offsets = self.string_offsets.tolist()
+        return [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+    def vocabulary(self):
+        return json.loads(self.vocabulary_json.tobytes().decode('utf-8'))
+
+    def registered_symptoms(self):
+        # Gejala yang hanya dirujuk penyakit (tanpa deskripsi) tidak termasuk daftar gejala
+        return self.symptom_table[:, 1] >= 0
+
+    def to_dicts(self):
+        strings = self.decode_strings() + [None]
+        symptom_rows = self.symptom_table.tolist()
+        symptom_codes = [strings[code_id] for code_id, _ in symptom_rows]
+        symptoms = {strings[code_id]: strings[desc_id] for code_id, desc_id in symptom_rows if desc_id >= 0}
+
+        cf_indptr = self.cf_indptr.tolist()
+        cf_indices = self.cf_indices.tolist()
+        cf_data = self.cf_data.tolist()
+        diseases = {}
+        for row, fields in enumerate(self.disease_table.tolist()):
+            start, end = cf_indptr[row], cf_indptr[row + 1]
+            disease = {
+                'name': strings[fields[1]],
+                'symptoms': {symptom_codes[index]: cf for index, cf in zip(cf_indices[start:end], cf_data[start:end])}
+            }
+            for field, string_id in zip(self.disease_fields[2:], fields[2:]):
+                if string_id >= 0:
+                    disease[field] = strings[string_id]
+            diseases[strings[fields[0]]] = disease
+
+        rule_cf = self.rule_cf.tolist()
+        rule_cond_indptr = self.rule_cond_indptr.tolist()
+        rule_cond_indices = self.rule_cond_indices.tolist()
+        rules = []
+        for row, fields in enumerate(self.rule_table.tolist()):
+            rule_id, name, conclusion, target_disease, description = [strings[string_id] for string_id in fields]
+            start, end = rule_cond_indptr[row], rule_cond_indptr[row + 1]
+            rules.append({
+                'id': rule_id,
+                'name': name,
+                'conditions': [strings[string_id] for string_id in rule_cond_indices[start:end]],
+                'conclusion': conclusion,
+                'cf': rule_cf[row],
+                'target_disease': target_disease,
+                'description': description
+            })
+
+        severity_multipliers = {
+            strings[string_id]: multiplier
+            for string_id, multiplier in zip(self.severity_table.tolist(), self.severity_data.tolist())
+        }
+
+        return diseases, symptoms, rules, severity_multipliers
+
+
+class AuditTraceStore:
+    # Jejak audit biner append-only: traces.bin (rekaman) + traces.idx (indeks ukuran tetap, urut waktu)
+    magic = b'AT'
+    version = 1
+    # magic, versi, jumlah gejala, versi knowledge base (8 byte), waktu (mikrodetik), ID konsultasi
+    header_format = '<2sBB8sqQ'
+    input_format = '<HB'
+    result_format = '<HHB'
+    term_format = '<Hf'
+    index_dtype = np.dtype([('consultation_id', '<u8'), ('timestamp', '<i8'), ('offset', '<u8'), ('length', '<u4'), ('pad', '<u4')])
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.data_path = os.path.join(directory, "traces.bin")
+        self.index_path = os.path.join(directory, "traces.idx")
+        self.lock = threading.Lock()
+        self.snapshots = {}
+        self.data_handle = None
+        self.index_handle = None
+
+        # Rekaman yang terputus saat crash tidak pernah masuk indeks, jadi cukup buang sisa indeks yang tidak utuh
+        index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if index_size % self.index_dtype.itemsize:
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(index_size - index_size % self.index_dtype.itemsize)
+        self.count = index_size // self.index_dtype.itemsize
+        self.last_id = self.read_last_id()
+
+    def read_last_id(self):
+        # ID berikutnya diambil dari entri terakhir di disk, bukan dari penghitung milik instans ini
+        if not os.path.exists(self.index_path):
+            return 0
+        with open(self.index_path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            size -= size % self.index_dtype.itemsize
+            if not size:
+                return 0
+            f.seek(size - self.index_dtype.itemsize)
+            entry = np.frombuffer(f.read(self.index_dtype.itemsize), dtype=self.index_dtype)
+        return int(entry['consultation_id'][0])
+
+    def save_snapshot(self, kb_version, snapshot):
+        # Salinan knowledge base per versi agar jejak lama tetap bisa dijelaskan setelah knowledge base diubah
+        import tempfile
+
+        path = os.path.join(self.directory, f"kb-{kb_version.hex()}.json")
+        snapshot_json = json.dumps(snapshot, ensure_ascii=False)
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if not os.path.exists(path):
+                # Nama sementara unik agar proses lain yang menulis versi sama tidak saling menimpa
+                fd, temp_file = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(snapshot_json)
+                os.replace(temp_file, path)
+            # Salinan hasil parse, bukan referensi ke dict knowledge base yang bisa diubah di tempat
+            self.snapshots[kb_version] = json.loads(snapshot_json)
+
+    def load_snapshot(self, kb_version):
+        if kb_version not in self.snapshots:
+            with open(os.path.join(self.directory, f"kb-{kb_version.hex()}.json"), 'r', encoding='utf-8') as f:
+                self.snapshots[kb_version] = json.load(f)
+        return self.snapshots[kb_version]
+
+    @classmethod
+    def encode(cls, consultation_id, timestamp_us, kb_version, inputs, rules, results):
+        import struct
+
+        parts = [struct.pack(cls.header_format, cls.magic, cls.version, len(inputs), kb_version, timestamp_us, consultation_id)]
+        parts.extend(struct.pack(cls.input_format, symptom, severity) for symptom, severity in inputs)
+        parts.append(struct.pack('<B', len(rules)))
+        parts.extend(struct.pack('<H', rule) for rule in rules)
+        parts.append(struct.pack('<B', len(results)))
+        for disease, confidence_tenths, terms in results:
+            parts.append(struct.pack(cls.result_format, disease, confidence_tenths, len(terms)))
+            parts.extend(struct.pack(cls.term_format, symptom, term) for symptom, term in terms)
+        return b''.join(parts)
+
+    @classmethod
+    def decode(cls, record):
+        import struct
+
+        magic, version, input_count, kb_version, timestamp_us, consultation_id = struct.unpack_from(cls.header_format, record)
+        if magic != cls.magic or version != cls.version:
+            raise ValueError("Rekaman jejak audit tidak valid")
+        offset = struct.calcsize(cls.header_format)
+        inputs = []
+        for _ in range(input_count):
+            inputs.append(struct.unpack_from(cls.input_format, record, offset))
+            offset += struct.calcsize(cls.input_format)
+        rule_count, = struct.unpack_from('<B', record, offset)
+        rules = list(struct.unpack_from(f'<{rule_count}H', record, offset + 1))
+        offset += 1 + 2 * rule_count
+        result_count, = struct.unpack_from('<B', record, offset)
+        offset += 1
+        results = []
+        for _ in range(result_count):
+            disease, confidence_tenths, term_count = struct.unpack_from(cls.result_format, record, offset)
+            offset += struct.calcsize(cls.result_format)
+            terms = []
+            for _ in range(term_count):
+                terms.append(struct.unpack_from(cls.term_format, record, offset))
+                offset += struct.calcsize(cls.term_format)
+            results.append((disease, confidence_tenths, terms))
+        return {
+            'consultation_id': consultation_id,
+            'timestamp': datetime.fromtimestamp(timestamp_us / 1e6),
+            'kb_version': kb_version,
+            'inputs': inputs,
+            'rules': rules,
+            'results': results
+        }
+
+    def append(self, timestamp, kb_version, inputs, rules, results):
+        with self.lock:
+            if self.data_handle is None:
+                self.data_handle = open(self.data_path, 'ab')
+                self.index_handle = open(self.index_path, 'ab')
+                # File bisa bertambah sejak dibuka terakhir (mis. setelah close()), jadi baca ulang dari indeks
+                self.count = self.index_handle.tell() // self.index_dtype.itemsize
+                self.last_id = self.read_last_id()
+            consultation_id = self.last_id + 1
+            record = self.encode(consultation_id, int(timestamp.timestamp() * 1e6), kb_version, inputs, rules, results)
+
+            # Data ditulis lebih dulu; entri indeks hanya ditambahkan setelah rekaman utuh di disk.
+            # fsync tidak dilakukan di sini: sync() dipanggil sekali per batch oleh flush_stats
+            offset = self.data_handle.tell()
+            self.data_handle.write(record)
+            self.data_handle.flush()
+            entry = np.array([(consultation_id, int(timestamp.timestamp() * 1e6), offset, len(record), 0)], dtype=self.index_dtype)
+            self.index_handle.write(entry.tobytes())
+            self.index_handle.flush()
+            self.count += 1
+            self.last_id = consultation_id
+            return consultation_id
+
+    def sync(self):
+        with self.lock:
+            if self.data_handle is not None:
+                os.fsync(self.data_handle.fileno())
+                os.fsync(self.index_handle.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.data_handle is not None:
+                os.fsync(self.data_handle.fileno())
+                os.fsync(self.index_handle.fileno())
+                self.data_handle.close()
+                self.index_handle.close()
+                self.data_handle = self.index_handle = None
+
+    def read_records(self, entries):
+        traces = []
+        with open(self.data_path, 'rb') as f:
+            for entry in entries:
+                f.seek(int(entry['offset']))
+                traces.append(self.decode(f.read(int(entry['length']))))
+        return traces
+
+    def read_index(self):
+        count = os.path.getsize(self.index_path) // self.index_dtype.itemsize if os.path.exists(self.index_path) else 0
+        if not count:
+            return None
+        return np.memmap(self.index_path, dtype=self.index_dtype, mode='r', shape=(count,))
+
+    def get(self, consultation_id):
+        if consultation_id < 1:
+            return None
+        index = self.read_index()
+        if index is None:
+            return None
+        # ID biasanya berurutan mulai dari 1 sehingga posisinya langsung diketahui; ID di entri tetap dicek
+        position = consultation_id - 1
+        if position >= len(index) or index['consultation_id'][position] != consultation_id:
+            matches = np.flatnonzero(index['consultation_id'] == consultation_id)
+            if len(matches) != 1:
+                return None
+            position = int(matches[0])
+        trace = self.read_records(index[position:position + 1])[0]
+        return trace if trace['consultation_id'] == consultation_id else None
+
+    def find_range(self, start, end, limit=None):
+        index = self.read_index()
+        if index is None:
+            return []
+        timestamps = index['timestamp']
+        lo = int(np.searchsorted(timestamps, int(start.timestamp() * 1e6), side='left'))
+        hi = int(np.searchsorted(timestamps, int(end.timestamp() * 1e6), side='right'))
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self.read_records(index[lo:hi])
+
+
+class ReferenceDiagnosisEngine:
+    # Implementasi awal yang lugas (dict, forward chaining iteratif) sebagai pembanding engine teroptimasi
+
+    def __init__(self, diseases, severity_multipliers, inference_rules):
+        self.diseases = diseases
+        self.severity_multipliers = severity_multipliers
+        self.inference_rules = inference_rules
+
+    def forward_chaining_inference(self, selected_symptoms):
+        working_memory = set(selected_symptoms.keys())
+        fired_rules = []
+
+        max_iterations = 10
+        iteration = 0
+
+        while iteration < max_iterations:
+            iteration += 1
+            new_facts_added = False
+
+            for rule in self.inference_rules:
+                if any(fired['id'] == rule['id'] for fired in fired_rules):
+                    continue
+
+                conditions_met = all(condition in working_memory for condition in rule['conditions'])
+
+                if conditions_met and rule['conclusion'] not in working_memory:
+                    working_memory.add(rule['conclusion'])
+                    fired_rules.append(rule.copy())
+                    new_facts_added = True
+
+            if not new_facts_added:
+                break
+
+        return working_memory, fired_rules
+
+    def calculate_combined_cf(self, disease_symptoms, selected_symptoms, inferred_facts=None):
+        if not disease_symptoms or not selected_symptoms:
+            return 0.0
+
+        cf_combined = 0.0
+        for symptom_code, base_cf in disease_symptoms.items():
+            if symptom_code in selected_symptoms:
+                severity_multiplier = self.severity_multipliers.get(selected_symptoms[symptom_code], 0.5)
+                cf_symptom = float(base_cf) * float(severity_multiplier)
+
+                if inferred_facts and symptom_code in inferred_facts:
+                    cf_symptom = min(1.0, cf_symptom)
+
+                if cf_combined == 0.0:
+                    cf_combined = cf_symptom
+                else:
+                    cf_combined = cf_combined + cf_symptom * (1 - cf_combined)
+
+        return cf_combined * 100
+
+    def diagnose(self, selected_symptoms):
+        inferred_facts, fired_rules = self.forward_chaining_inference(selected_symptoms)
+
+        scores = {}
+        results = []
+        for disease_code, disease in self.diseases.items():
+            if not isinstance(disease.get('symptoms'), dict):
+                continue
+
+            cf_combined = self.calculate_combined_cf(disease['symptoms'], selected_symptoms, inferred_facts)
+            scores[disease_code] = cf_combined
+
+            matching_symptoms = [symptom for symptom in disease['symptoms'].keys() if symptom in selected_symptoms]
+            if cf_combined >= 40.0 and matching_symptoms:
+                results.append({
+                    'code': disease_code,
+                    'confidence': round(cf_combined, 1),
+                    'matching_symptoms': matching_symptoms,
+                    'fired_rules': [rule['id'] for rule in fired_rules if rule.get('target_disease') == disease_code]
+                })
+
+        results.sort(key=lambda x: x['confidence'], reverse=True)
+        return results, scores
+
 
 class EarDiagnosisSystem:
-    def __init__(self):
-        self.data_dir = "data"
-        self.data_file = os.path.join(self.data_dir, "ear_diagnosis_data.json")
-        self.stats_file = os.path.join(self.data_dir, "consultation_stats.json")
+    def __init__(self, verbose=True, durability_mode='periodic', save_interval=5, group_commit_delay=0.005, group_commit_timeout=5, stats_file=None,
+                 stats_backend=None, node_id=None, sync_interval=10, kb_name='ear', data_dir="data", audit=True):
+        if durability_mode not in DURABILITY_MODES:
+            raise ValueError(f"Mode durabilitas tidak dikenal: {durability_mode} (pilihan: {', '.join(DURABILITY_MODES)})")
+        self.verbose = verbose
+        self.kb_name = kb_name
+        self.data_dir = data_dir
+        self.data_file = os.path.join(self.data_dir, f"{kb_name}_diagnosis_data.json")
+        self.compiled_file = os.path.join(self.data_dir, f"{kb_name}_diagnosis_data.kb")
+        self.compiled_kb = None
+        # True bila file biner baru dimuat/dikompilasi dari data yang sama dengan dict saat ini
+        self.compiled_tables_pending = False
+        self.inference_rules = DEFAULT_INFERENCE_RULES
+        self.load_vocabulary({})
+        # Tiap replika menyimpan hitungannya sendiri; total global didapat dari backend statistik
+        self.node_id = node_id or socket.gethostname()
+        self.stats_backend = stats_backend or StatsBackend()
+        self.replicated = stats_backend is not None
+        self.sync_interval = sync_interval
+        self.replica_view = {}
+        # Nama file lama dipertahankan untuk knowledge base telinga
+        stats_name = "consultation_stats" if kb_name == 'ear' else f"consultation_stats_{kb_name}"
+        default_stats_name = f"{stats_name}-{node_id}.json" if node_id else f"{stats_name}.json"
+        self.stats_file = stats_file or os.path.join(self.data_dir, default_stats_name)
+        audit_name = f"{kb_name}-{node_id}" if node_id else kb_name
+        self.audit_store = AuditTraceStore(os.path.join(self.data_dir, "audit", audit_name)) if audit else None
         self.stats_lock = threading.Lock() 
         self.last_save_time = time.time()
-        self.save_interval = 5 
+        self.save_interval = save_interval
+        self.durability_mode = durability_mode
+        self.group_commit_delay = group_commit_delay
+        self.group_commit_timeout = group_commit_timeout
+        # Nomor urut perubahan statistik vs nomor urut yang sudah tersimpan di disk
+        self.stats_dirty_seq = 0
+        self.stats_durable_seq = 0
+        self.stats_writes = 0
+        self.stats_commit_cond = threading.Condition()
+        self.stats_write_lock = threading.Lock()
+        self.cache_lock = threading.Lock()
+        self.diagnosis_cache_size = 1024
+        # Batas bawah P(ya | penyakit) konsultasi adaptif; gejala yang tidak dimiliki penyakit tepat di batas ini
+        self.adaptive_floor = 0.05
+        self.closed = threading.Event()
 
-        self.severity_multipliers = {
-            "tidak_parah": 0.3,
-            "lumayan_parah": 0.6,  
-            "parah": 0.85,           
-            "sangat_parah": 1.0     
-        }
+        self.severity_multipliers = dict(DEFAULT_SEVERITY_MULTIPLIERS)
 
         self.severity_labels = {
             "tidak_parah": "😊 Tidak Parah",
@@ -35,32 +1359,116 @@ class EarDiagnosisSystem:
         os.makedirs(self.data_dir, exist_ok=True)
         
         self.load_data()
+        self.compile_rules()
+        self.prepare_scoring_tables()
         self.consultation_count = 0
         self.disease_stats = {}
+        self.rollups = ConsultationRollups()
+        self.sketches = SymptomSketches()
         self.load_stats()
 
+        self.group_commit_thread = None
+        if self.durability_mode == 'group-commit':
+            self.group_commit_thread = threading.Thread(target=self.group_commit_loop, name="stats-group-commit", daemon=True)
+            self.group_commit_thread.start()
+        atexit.register(self.flush_stats)
+
+        if self.replicated:
+            self.sync_replicas()
+            threading.Thread(target=self.replication_loop, name="stats-replication", daemon=True).start()
+            atexit.register(self.sync_replicas)
+
     def load_data(self):
+        if self.load_compiled_data():
+            return
+
         if os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.diseases = data.get('diseases', {})
                     self.symptoms = data.get('symptoms', {})
+                    self.severity_multipliers.update(data.get('severity_multipliers', {}))
+                    self.inference_rules = data.get('inference_rules', DEFAULT_INFERENCE_RULES)
+                    self.load_vocabulary(data)
+                self.compile_data()
             except Exception as e:
                 print(f"Error loading data: {e}")
                 self.create_default_data()
         else:
             self.create_default_data()
 
+    def default_vocabulary(self):
+        # Sinonim & kelompok bawaan hanya untuk knowledge base telinga; knowledge base lain memakai miliknya sendiri
+        if self.kb_name == 'ear':
+            return DEFAULT_SYMPTOM_SYNONYMS, [[title, list(codes)] for title, codes in DEFAULT_SYMPTOM_GROUPS]
+        return {}, []
+
+    def load_vocabulary(self, data):
+        default_synonyms, default_groups = self.default_vocabulary()
+        self.symptom_synonyms = data.get('synonyms', default_synonyms)
+        self.symptom_groups = data.get('symptom_groups', default_groups)
+
+    def vocabulary_data(self):
+        # Hanya yang berbeda dari bawaan yang ikut disimpan
+        default_synonyms, default_groups = self.default_vocabulary()
+        data = {}
+        if self.symptom_synonyms != default_synonyms:
+            data['synonyms'] = self.symptom_synonyms
+        if self.symptom_groups != default_groups:
+            data['symptom_groups'] = self.symptom_groups
+        return data
+
+    def load_compiled_data(self):
+        if not os.path.exists(self.compiled_file):
+            return False
+        try:
+            compiled_kb = CompiledKnowledgeBase.open(self.compiled_file)
+            if not compiled_kb.is_fresh(self.data_file):
+                # JSON tetap menjadi sumber utama; file biner yang usang diabaikan
+                return False
+            # Teks dan struktur tetap didekode menjadi dict Python milik proses ini (tidak dibagi antar proses);
+            # yang dipakai langsung dari halaman mmap hanya array CSR untuk matriks CF (lihat prepare_scoring_tables)
+            self.diseases, self.symptoms, self.inference_rules, severity_multipliers = compiled_kb.to_dicts()
+            self.load_vocabulary(compiled_kb.vocabulary())
+            self.severity_multipliers.update(severity_multipliers)
+            self.compiled_kb = compiled_kb
+            self.compiled_tables_pending = True
+            return True
+        except Exception as e:
+            print(f"Error loading compiled data: {e}")
+            return False
+
+    def compile_data(self):
+        try:
+            CompiledKnowledgeBase.compile(
+                self.diseases, self.symptoms, self.inference_rules,
+                self.compiled_file, source_path=self.data_file,
+                severity_multipliers=self.severity_multipliers, vocabulary=self.vocabulary_data()
+            )
+            self.compiled_kb = CompiledKnowledgeBase.open(self.compiled_file)
+            self.compiled_tables_pending = True
+            return True
+        except Exception as e:
+            print(f"Error compiling data: {e}")
+            return False
+
     def save_data(self):
         data = {
             'diseases': self.diseases,
             'symptoms': self.symptoms,
+            'severity_multipliers': self.severity_multipliers,
             'last_updated': datetime.now().isoformat()
         }
+        if self.inference_rules != DEFAULT_INFERENCE_RULES:
+            data['inference_rules'] = self.inference_rules
+        data.update(self.vocabulary_data())
         try:
             with open(self.data_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            self.compile_data()
+            self.compile_rules()
+            self.prepare_scoring_tables()
             return True
         except Exception as e:
             print(f"Error saving data: {e}")
@@ -73,15 +1481,20 @@ class EarDiagnosisSystem:
                     stats = json.load(f)
                     self.consultation_count = stats.get('consultation_count', 0)
                     self.disease_stats = stats.get('disease_stats', {})
+                    self.rollups = ConsultationRollups(stats.get('rollups'))
+                    self.sketches = SymptomSketches(stats.get('sketches'))
             except Exception as e:
                 print(f"Error loading stats: {e}")
 
     def save_stats(self):
-        stats = {
-            'consultation_count': self.consultation_count,
-            'disease_stats': self.disease_stats,
-            'last_updated': datetime.now().isoformat()
-        }
+        with self.stats_lock:
+            stats = {
+                'consultation_count': self.consultation_count,
+                'disease_stats': self.disease_stats.copy(),
+                'rollups': self.rollups.to_dict(),
+                'sketches': self.sketches.to_dict(),
+                'last_updated': datetime.now().isoformat()
+            }
         try:
             with open(self.stats_file, 'w', encoding='utf-8') as f:
                 json.dump(stats, f, ensure_ascii=False, indent=2)
@@ -165,6 +1578,16 @@ class EarDiagnosisSystem:
             self.save_data()
 
     def get_symptoms_list(self):
+        if 'symptoms' not in self.catalogue_pages:
+            self.catalogue_pages['symptoms'] = self.render_symptoms_list()
+        return self.catalogue_pages['symptoms']
+
+    def get_diseases_list(self):
+        if 'diseases' not in self.catalogue_pages:
+            self.catalogue_pages['diseases'] = self.render_diseases_list()
+        return self.catalogue_pages['diseases']
+
+    def render_symptoms_list(self):
         if not self.symptoms:
             return "❌ Tidak ada gejala yang tersedia."
         
@@ -222,7 +1645,7 @@ class EarDiagnosisSystem:
         result += "---\n**💡 Tips**: Pilih semua gejala yang Anda rasakan untuk mendapatkan diagnosis yang lebih akurat."
         return result
 
-    def get_diseases_list(self):
+    def render_diseases_list(self):
         if not self.diseases:
             return "❌ Tidak ada penyakit yang tersedia."
         
@@ -251,19 +1674,22 @@ class EarDiagnosisSystem:
         return result
 
     def get_consultation_stats(self):
+        consultation_count, disease_stats, replicas = self.global_stats()
         result = f"# 📊 Statistik Konsultasi Sistem\n\n"
         
         result += f"## 📈 Statistik Umum\n"
-        result += f"- **Total Konsultasi**: {self.consultation_count:,} kali\n"
+        result += f"- **Total Konsultasi**: {consultation_count:,} kali\n"
+        if replicas > 1:
+            result += f"- **Replika Server**: {replicas} node (total global, disinkronkan tiap {self.sync_interval:g} detik)\n"
         result += f"- **Jumlah Penyakit**: {len(self.diseases)} jenis\n"
         result += f"- **Jumlah Gejala**: {len(self.symptoms)} gejala\n"
         result += f"- **Terakhir Diperbarui**: {datetime.now().strftime('%d %B %Y, %H:%M WIB')}\n\n"
         
-        if self.disease_stats:
+        if disease_stats:
             result += "## 🏆 Diagnosa Terpopuler\n"
-            sorted_stats = sorted(self.disease_stats.items(), key=lambda x: x[1], reverse=True)
+            sorted_stats = sorted(disease_stats.items(), key=lambda x: x[1], reverse=True)
             
-            total_diagnoses = sum(self.disease_stats.values())
+            total_diagnoses = sum(disease_stats.values())
             
             for i, (disease, count) in enumerate(sorted_stats[:5], 1):
                 percentage = (count / total_diagnoses) * 100 if total_diagnoses > 0 else 0
@@ -273,141 +1699,661 @@ class EarDiagnosisSystem:
         else:
             result += "## 🏆 Diagnosa Terpopuler\n"
             result += "Belum ada data konsultasi yang tersimpan.\n\n"
-        
-        if self.consultation_count > 0:
+
+        result += self.get_consultation_trends()
+        result += self.get_symptom_patterns()
+
+        if consultation_count > 0:
             result += "## 🎯 Informasi Sistem\n"
             result += f"- **Rata-rata gejala per konsultasi**: Bervariasi\n"
             result += f"- **Sistem aktif sejak**: Instalasi pertama\n"
             result += f"- **Status sistem**: ✅ Berjalan normal\n\n"
         
         result += "---\n**💡 Catatan**: Statistik ini membantu meningkatkan akurasi sistem diagnosis."
-        
+
+        return result
+
+    def get_symptom_patterns(self, limit=5):
+        # Salinan gabungan semua replika, jadi tidak terpengaruh add() di thread request lain
+        sketches = self.global_sketches()
+        combinations = sketches.combinations.most_common(limit)
+        pairs = sketches.cooccurrence.most_common(limit)
+        if not combinations:
+            return ""
+
+        result = "## 🧩 Pola Gejala Tersering\n\n"
+        result += "| Kombinasi Gejala | Perkiraan |\n|---|---|\n"
+        for key, count in combinations:
+            selected = SymptomSketches.parse_combination_key(key)
+            described = ", ".join(f"{code} ({self.severity_labels.get(severity, severity)})" for code, severity in selected.items())
+            result += f"| {described} | ~{count} |\n"
+
+        if pairs:
+            result += "\n**Gejala yang sering muncul bersamaan:**\n"
+            for key, count in pairs:
+                first, second = key.split("+")
+                result += f"- {first} ({self.symptoms.get(first, 'Unknown')}) + {second} ({self.symptoms.get(second, 'Unknown')}): ~{count} kali\n"
+
+        memory = (sketches.combinations.table.nbytes + sketches.cooccurrence.table.nbytes) // 1024
+        result += f"\n*Perkiraan count-min sketch (memori tetap {memory} KB, bisa sedikit melebihi nilai sebenarnya).*\n\n"
         return result
 
-    def process_diagnosis(self, *args):
+    def get_consultation_trends(self, now=None):
+        now = now or datetime.now()
+        return self.render_consultation_trends(now, self.global_rollups(now))
+
+    def render_consultation_trends(self, now, rollups):
+        daily = rollups.series('day', now - timedelta(days=6), now)
+        if not any(count for _, count in daily):
+            return ""
+
+        result = "## 📉 Tren Konsultasi\n\n"
+
+        hourly = rollups.series('hour', now - timedelta(hours=23), now)
+        last_24h = sum(count for _, count in hourly)
+        peak_hour, peak_count = max(hourly, key=lambda point: point[1])
+        result += f"- **24 jam terakhir**: {last_24h:,} konsultasi\n"
+        if peak_count:
+            result += f"- **Jam tersibuk**: {peak_hour.strftime('%H:00')} ({peak_count} konsultasi)\n"
+
+        symptom_totals = rollups.totals('day', now - timedelta(days=6), now, 'symptoms')
+        if symptom_totals:
+            top_symptom = max(symptom_totals.items(), key=lambda x: x[1])
+            result += f"- **Gejala tersering (7 hari)**: {top_symptom[0]} - {self.symptoms.get(top_symptom[0], 'Unknown')} ({top_symptom[1]} kali)\n"
+
+        severity_totals = rollups.totals('day', now - timedelta(days=6), now, 'severities')
+        if severity_totals:
+            total_severity = sum(severity_totals.values())
+            distribution = ", ".join(
+                f"{self.severity_labels.get(severity, severity)} {count / total_severity * 100:.0f}%"
+                for severity, count in sorted(severity_totals.items(), key=lambda x: x[1], reverse=True)
+            )
+            result += f"- **Distribusi keparahan (7 hari)**: {distribution}\n"
+
+        result += "\n| Tanggal | Konsultasi | Diagnosa Teratas |\n|---|---|---|\n"
+        daily_diagnoses = rollups.series('day', now - timedelta(days=6), now, 'diagnoses')
+        for (day, count), (_, diagnoses) in zip(daily, daily_diagnoses):
+            top = max(diagnoses.items(), key=lambda x: x[1])[0] if diagnoses else "-"
+            result += f"| {day.strftime('%d %b')} | {count} | {top} |\n"
+
+        return result + "\n"
+
+    def parse_symptom_inputs(self, payload):
+        # Payload ringkas dari form: {"G01": "parah", ...} (dict atau string JSON)
+        if isinstance(payload, str):
+            payload = json.loads(payload) if payload.strip() else {}
+        if not isinstance(payload, dict):
+            raise ValueError(f"payload gejala harus berupa objek, bukan {type(payload).__name__}")
 
-        symptom_mapping = [
-            'G01', 'G02', 'G05', 'G06',    # Grup 1: 4 gejala
-            'G08', 'G09', 'G11', 'G12',    # Grup 2: 4 gejala  
-            'G03', 'G04', 'G07',           # Grup 3: 3 gejala
-            'G10'                          # Grup 4: 1 gejala
-        ]  # Total: 12 gejala sesuai dengan data
-        
         selected_symptoms = {}
-        
+        for symptom_code, severity in payload.items():
+            if symptom_code not in self.symptoms:
+                continue
+            if severity not in self.severity_multipliers:
+                severity = "tidak_parah"
+            selected_symptoms[symptom_code] = severity
+
+        return selected_symptoms
+
+    def get_form_layout(self):
+        # Kelompok dari knowledge base (bawaan untuk telinga); gejala di luar kelompok masuk ke kelompok tambahan
+        layout = []
+        grouped = set()
+        for title, codes in self.symptom_groups:
+            codes = [code for code in codes if code in self.symptoms]
+            grouped.update(codes)
+            if codes:
+                layout.append((title, codes))
+        remaining = [code for code in self.symptoms if code not in grouped]
+        if remaining:
+            layout.append(("🩺 Gejala Lainnya" if layout else "🩺 Daftar Gejala", remaining))
+        return layout
+
+    def process_diagnosis(self, payload):
+
         try:
-            for i in range(0, len(args), 2):
-                if i + 1 < len(args): 
-                    symptom_index = i // 2
-                    if symptom_index < len(symptom_mapping):
-                        symptom_code = symptom_mapping[symptom_index]
-                        is_selected = bool(args[i]) 
-                        severity = str(args[i + 1]) if args[i + 1] else "tidak_parah"
-                        
-                        valid_severities = ["tidak_parah", "lumayan_parah", "parah", "sangat_parah"]
-                        if severity not in valid_severities:
-                            severity = "tidak_parah"
-                        
-                        if is_selected:
-                            selected_symptoms[symptom_code] = severity
-                            
+            selected_symptoms = self.parse_symptom_inputs(payload)
         except (IndexError, TypeError, ValueError) as e:
             print(f"ERROR: Argument parsing failed - {e}")
             error_result = "❌ **Terjadi kesalahan dalam memproses input!**\n\nSilakan refresh halaman dan coba lagi."
             return error_result, "", "", self.get_consultation_stats()
 
-        print(f"DEBUG: Selected symptoms parsed: {selected_symptoms}")
+        if self.verbose:
+            print(f"DEBUG: Selected symptoms parsed: {selected_symptoms}")
 
         if not selected_symptoms:
             empty_result = "❌ **Silakan pilih minimal satu gejala terlebih dahulu!**\n\nPilih gejala yang Anda rasakan dari daftar di atas untuk mendapatkan diagnosis yang akurat."
             return empty_result, "", "", self.get_consultation_stats()
 
+        return self.run_consultation(selected_symptoms)
+
+    def run_consultation(self, selected_symptoms):
+        results, (selected_text, diagnosis_text, solution_text) = self.cached_diagnosis(selected_symptoms)
+        # Jejak dicatat lebih dulu agar di mode group-commit ikut di-fsync bersama batch statistiknya
+        consultation_id = self.record_audit_trace(selected_symptoms, results)
+        durable = self.update_consultation_stats(results[0].name if results else None, selected_symptoms)
+        if consultation_id is not None:
+            selected_text = f"🧾 **ID Konsultasi:** #{consultation_id}\n\n" + selected_text
+
+        updated_stats = self.get_consultation_stats()
+        if not durable:
+            updated_stats = "⚠️ **Statistik konsultasi ini belum tersimpan ke disk.** Sistem akan terus mencoba menyimpannya.\n\n" + updated_stats
+
+        return selected_text, diagnosis_text, solution_text, updated_stats
+
+    def process_free_text(self, text):
+        if not text or not text.strip():
+            return "❌ **Silakan ceritakan gejala yang Anda rasakan terlebih dahulu.**", "", "", self.get_consultation_stats()
+
+        selected_symptoms, candidates, excluded = self.symptom_text_index.parse_free_text(text)
+        excluded_text = ""
+        for clause, code, score in excluded:
+            excluded_text += f"- 🚫 *\"{clause}\"* → {code} {self.symptoms.get(code, 'Unknown')} ({score:.0%}) dikecualikan\n"
+
+        if not selected_symptoms:
+            message = "❌ **Gejala tidak dikenali dari teks.**\n\nCoba gunakan kata lain atau pilih gejala dari daftar di atas."
+            if excluded_text:
+                message += "\n\n**Gejala yang Anda sangkal:**\n\n" + excluded_text
+            return message, "", "", self.get_consultation_stats()
+
+        matched_text = "### ✍️ Gejala dari Cerita Anda\n\n"
+        for clause, matches in candidates:
+            described = ", ".join(f"{code} {self.symptoms.get(code, 'Unknown')} ({score:.0%})" for code, score in matches)
+            matched_text += f"- *\"{clause}\"* → {described}\n"
+        matched_text += excluded_text + "\n"
+
+        selected_text, diagnosis_text, solution_text, updated_stats = self.run_consultation(selected_symptoms)
+        return matched_text + selected_text, diagnosis_text, solution_text, updated_stats
+
+    def kb_snapshot(self):
+        return {
+            'kb_name': self.kb_name,
+            'symptoms': self.symptoms,
+            'diseases': self.diseases,
+            'inference_rules': self.inference_rules,
+            'severity_multipliers': self.severity_multipliers,
+            'symptom_codes': self.matrix_symptom_codes,
+            'disease_codes': self.matrix_disease_codes
+        }
+
+    def record_audit_trace(self, selected_symptoms, results):
+        if self.audit_store is None:
+            return None
+
+        _, fired_rules = self.forward_chaining_inference(selected_symptoms)
+        inputs = [(self.symptom_positions[code], self.severity_positions[severity]) for code, severity in selected_symptoms.items()]
+        rules = [self.rule_positions[rule.id] for rule in fired_rules]
+        # Suku CF per gejala disimpan sesuai urutan penggabungan, jadi rantai derivasinya bisa diulang persis
+        encoded_results = []
+        for result in results:
+            base_cfs = dict(result.disease.symptoms)
+            terms = [
+                (self.symptom_positions[code], base_cfs[code] * self.severity_multipliers[selected_symptoms[code]])
+                for code in result.matching_symptoms
+            ]
+            encoded_results.append((self.disease_positions[result.code], int(round(result.confidence * 10)), terms))
+
+        try:
+            if self.kb_version not in self.audit_store.snapshots:
+                self.audit_store.save_snapshot(self.kb_version, self.kb_snapshot())
+            return self.audit_store.append(datetime.now(), self.kb_version, inputs, rules, encoded_results)
+        except OSError as e:
+            print(f"❌ Error writing audit trace: {e}")
+            return None
+
+    def get_audit_trace(self, consultation_id):
+        if self.audit_store is None:
+            return None
+        return self.audit_store.get(consultation_id)
+
+    def explain_trace(self, trace):
+        # Penjelasan lengkap dibangun ulang dari jejak biner + salinan knowledge base pada versi saat konsultasi
+        snapshot = self.audit_store.load_snapshot(trace['kb_version'])
+        symptom_codes = snapshot['symptom_codes']
+        disease_codes = snapshot['disease_codes']
+        severity_levels = list(snapshot['severity_multipliers'])
+        rules = [Rule.from_dict(rule) for rule in snapshot['inference_rules']]
+
+        text = f"# 🧾 Jejak Audit Konsultasi #{trace['consultation_id']}\n\n"
+        text += f"- **Waktu:** {trace['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}\n"
+        text += f"- **Knowledge Base:** {snapshot['kb_name']} (versi `{trace['kb_version'].hex()}`)\n\n"
+
+        text += "## 📋 Gejala yang Dipilih\n\n"
+        for i, (symptom, severity) in enumerate(trace['inputs'], 1):
+            code = symptom_codes[symptom]
+            severity = severity_levels[severity]
+            text += f"{i}. **{code}**: {snapshot['symptoms'].get(code, 'Unknown')} — *{self.severity_labels.get(severity, severity)}*"
+            text += f" (multiplier {snapshot['severity_multipliers'][severity]})\n"
+        text += "\n"
+
+        text += self.get_inference_explanation([rules[rule] for rule in trace['rules']])
+
+        if not trace['results']:
+            return text + "## 🤔 Hasil Diagnosis\n\n**Tidak ditemukan penyakit yang sesuai.**\n"
+
+        text += "## 🎯 Derivasi Certainty Factor\n\n"
+        for i, (disease, confidence_tenths, terms) in enumerate(trace['results']):
+            code = disease_codes[disease]
+            disease_data = snapshot['diseases'][code]
+            rank_emoji = "🏆" if i == 0 else f"#{i+1}"
+            text += f"### {rank_emoji} {disease_data['name']} — CF {confidence_tenths / 10:.1f}%\n\n"
+
+            for symptom, term in terms:
+                symptom_code = symptom_codes[symptom]
+                base_cf = disease_data['symptoms'].get(symptom_code, 0)
+                text += f"- **{symptom_code}**: CF Penyakit {base_cf:.2f} → **CF Gejala:** {term:.2f}\n"
+
+            if terms:
+                cf_explanation = f"{terms[0][1]:.2f}"
+                cf_combined = terms[0][1]
+                for _, term in terms[1:]:
+                    cf_explanation += f" + {term:.2f} × (1 - {cf_combined:.2f})"
+                    cf_combined = cf_combined + term * (1 - cf_combined)
+                text += f"\n📊 **Perhitungan CF Gabungan:** {cf_explanation} = **{cf_combined * 100:.1f}%**\n\n"
+
+        return text
+
+    def diagnose(self, selected_symptoms):
         inferred_facts, fired_rules = self.forward_chaining_inference(selected_symptoms)
-        
+
+        fired_by_target = {}
+        for rule in fired_rules:
+            fired_by_target[rule.target_disease] = fired_by_target.get(rule.target_disease, ()) + (rule,)
+
         results = []
-        for disease_code, disease in self.diseases.items():
-            print(f"🔍 Analyzing disease: {disease_code} - {disease['name']}")
-            
-            if not isinstance(disease.get('symptoms'), dict):
-                print(f"   ❌ SKIP: Invalid symptoms structure")
-                continue
+        for disease in self.disease_models.values():
+            if self.verbose:
+                print(f"🔍 Analyzing disease: {disease.code} - {disease.name}")
 
             cf_combined = self.calculate_combined_cf(
-                disease['symptoms'], 
-                selected_symptoms, 
+                disease.symptoms,
+                selected_symptoms,
                 inferred_facts
             )
-            
-            matching_symptoms = [
-                symptom for symptom in disease['symptoms'].keys() 
-                if symptom in selected_symptoms
-            ]
-            
-            print(f"   CF Combined: {cf_combined:.2f}%")
-            print(f"   Matching symptoms: {len(matching_symptoms)}/{len(disease['symptoms'])}")
-            
-            # Threshold minimum untuk ditampilkan (40%)
-            if cf_combined >= 40.0 and matching_symptoms:
-                
-                result = {
-                    'code': disease_code,
-                    'name': disease['name'],
-                    'info': disease['info'],
-                    'solution': disease['solution'],
-                    'severity': disease.get('severity', 'Tidak diketahui'),
-                    'duration': disease.get('duration', 'Bervariasi'),
-                    'matching_symptoms': matching_symptoms,
-                    'confidence': round(cf_combined, 1),
-                    'total_symptoms': len(disease['symptoms']),
-                    'matched_count': len(matching_symptoms),
-                    'match_ratio': round((len(matching_symptoms) / len(disease['symptoms'])) * 100, 1),
-                    'fired_rules': [rule for rule in fired_rules if rule.get('target_disease') == disease_code],
-                    'risk_level': self.calculate_risk_level(cf_combined, disease.get('severity', 'Sedang'))
-                }
-                
+
+            if self.verbose:
+                print(f"   CF Combined: {cf_combined:.2f}%")
+
+            # Threshold minimum untuk ditampilkan (40%); CF > 0 berarti minimal satu gejala cocok
+            if cf_combined >= 40.0:
+
+                result = self.make_diagnosis_result(
+                    disease, cf_combined, selected_symptoms,
+                    fired_by_target.get(disease.code, ())
+                )
+
                 results.append(result)
-                print(f"   ✅ ADDED: {disease['name']} - CF: {cf_combined:.1f}%")
-            else:
+                if self.verbose:
+                    print(f"   ✅ ADDED: {disease.name} - CF: {cf_combined:.1f}%")
+            elif self.verbose:
                 print(f"   ❌ SKIP: CF too low ({cf_combined:.1f}%) or no matches")
 
-        print(f"DEBUG: Total valid results: {len(results)}")
+        if self.verbose:
+            print(f"DEBUG: Total valid results: {len(results)}")
 
-        if results:
-            for result in results:
-                result['diagnosis_score'] = self.calculate_diagnosis_score(result)
-            
-            results.sort(key=lambda x: x['diagnosis_score'], reverse=True)
+        results.sort(key=self.calculate_diagnosis_score, reverse=True)
 
+        return results
 
-        selected_text, diagnosis_text, solution_text = self.format_results(selected_symptoms, results)
-        updated_stats = self.get_consultation_stats()
+    def make_diagnosis_result(self, disease, cf_combined, selected_symptoms, fired_rules):
+        # tuple(list) alih-alih tuple(generator): resize tuple dari generator ikut memicu GC generasi 0
+        matching_symptoms = tuple([code for code, _ in disease.symptoms if code in selected_symptoms])
+        return DiagnosisResult(
+            disease,
+            matching_symptoms,
+            round(cf_combined, 1),
+            round((len(matching_symptoms) / len(disease.symptoms)) * 100, 1),
+            fired_rules,
+            self.calculate_risk_level(cf_combined, disease.severity)
+        )
 
-        return selected_text, diagnosis_text, solution_text, updated_stats
-    
-    def update_consultation_stats(self, top_disease_name):
+    def evaluate_hypothesis(self, disease_code, selected_symptoms):
+        disease = self.disease_models.get(disease_code)
+        if disease is None:
+            return None
+
+        memo = {}
+        visiting = set()
+        explored_rules = set()
+
+        def prove(fact):
+            # Mengembalikan aturan pendukung (atau True untuk gejala), None jika tidak terbukti
+            if fact in selected_symptoms:
+                return True
+            if fact in memo:
+                return memo[fact]
+            if fact in visiting:
+                return None
+            visiting.add(fact)
+            support = None
+            for rule in self.rules_by_conclusion.get(fact, ()):
+                explored_rules.add(rule.id)
+                if all(prove(condition) is not None for condition in rule.conditions):
+                    # Aturan pertama (urutan strata) yang terpenuhi adalah yang terpicu pada forward chaining
+                    support = rule
+                    break
+            visiting.discard(fact)
+            memo[fact] = support
+            return support
+
+        def rule_chain(rule, chain):
+            for condition in rule.conditions:
+                support = memo.get(condition)
+                if isinstance(support, Rule) and support not in chain:
+                    rule_chain(support, chain)
+            if rule not in chain:
+                chain.append(rule)
+            return chain
+
+        fired_rules = []
+        chain = []
+        for rule in self.rules_by_target.get(disease_code, ()):
+            explored_rules.add(rule.id)
+            if rule.conclusion not in selected_symptoms and prove(rule.conclusion) is rule:
+                fired_rules.append(rule)
+                rule_chain(rule, chain)
+
+        cf_combined = self.calculate_combined_cf(disease.symptoms, selected_symptoms, selected_symptoms)
+        result = self.make_diagnosis_result(disease, cf_combined, selected_symptoms, tuple(fired_rules))
+
+        return {
+            'result': result,
+            'supported': cf_combined >= 40.0,
+            'rule_chain': tuple(chain),
+            'explored_rules': sorted(explored_rules),
+            'explored_symptoms': len(disease.symptoms)
+        }
+
+    def process_hypothesis(self, disease_choice, payload):
+        disease_code = str(disease_choice or "").split(":")[0].strip()
+        if disease_code not in self.diseases:
+            return "❌ **Silakan pilih penyakit yang ingin diverifikasi terlebih dahulu!**"
+
+        try:
+            selected_symptoms = self.parse_symptom_inputs(payload)
+        except (IndexError, TypeError, ValueError) as e:
+            print(f"ERROR: Argument parsing failed - {e}")
+            return "❌ **Terjadi kesalahan dalam memproses input!**\n\nSilakan refresh halaman dan coba lagi."
+
+        if not selected_symptoms:
+            return "❌ **Silakan pilih minimal satu gejala terlebih dahulu!**"
+
+        hypothesis = self.evaluate_hypothesis(disease_code, selected_symptoms)
+        result = hypothesis['result']
+
+        status = "✅ **Hipotesis didukung**" if hypothesis['supported'] else "❌ **Hipotesis tidak didukung** (CF di bawah 40% atau tidak ada gejala cocok)"
+        text = f"# 🎯 Verifikasi Hipotesis: {result.name}\n\n"
+        text += f"{status}\n\n"
+        text += f"- **Confidence Factor (CF):** {result.confidence}%\n"
+        text += f"- **Gejala Cocok:** {result.matched_count} dari {result.total_symptoms} gejala ({result.match_ratio}%)\n"
+        text += f"- **Tingkat Risiko:** {result.risk_level}\n\n"
+
+        if result.matching_symptoms:
+            text += "### ✅ Gejala Pendukung\n"
+            for code in result.matching_symptoms:
+                base_cf = self.diseases[disease_code]['symptoms'][code]
+                multiplier = self.severity_multipliers.get(selected_symptoms[code], 0.5)
+                text += f"- **{code}**: {self.symptoms.get(code, 'Unknown')} — {base_cf:.2f} × {multiplier} = {base_cf * multiplier:.2f}\n"
+            text += "\n"
+
+        if hypothesis['rule_chain']:
+            text += "### 🧠 Rantai Aturan (Backward Chaining)\n"
+            for rule in hypothesis['rule_chain']:
+                text += f"- **{rule.id} - {rule.name}**: {', '.join(rule.conditions)} → {rule.conclusion}\n"
+            text += "\n"
+
+        text += f"*Aturan yang ditelusuri: {len(hypothesis['explored_rules'])} dari {len(self.inference_rules)}*"
+        return text
+
+    def parse_batch_record(self, record):
+        valid_severities = ["tidak_parah", "lumayan_parah", "parah", "sangat_parah"]
+        selected_symptoms = {}
+
+        raw = record.get('symptoms')
+        if isinstance(raw, str):
+            # Format ringkas: "G01:parah;G04:sangat_parah;G10"
+            entries = {}
+            for item in raw.replace(',', ';').split(';'):
+                item = item.strip()
+                if item:
+                    code, _, severity = item.partition(':')
+                    entries[code.strip()] = severity.strip()
+            raw = entries
+
+        if not isinstance(raw, dict):
+            # Format lebar: satu kolom per kode gejala
+            raw = {code: record.get(code) for code in self.symptoms if code in record}
+
+        for code, severity in raw.items():
+            if code not in self.symptoms:
+                continue
+            if severity is None or (isinstance(severity, float) and np.isnan(severity)):
+                continue
+            severity = str(severity).strip()
+            if severity.lower() in ("", "0", "false", "no", "tidak"):
+                continue
+            if severity not in valid_severities:
+                severity = "tidak_parah"
+            selected_symptoms[code] = severity
+
+        return selected_symptoms
+
+    def score_batch_records(self, records, id_column='id'):
+        scored = []
+        for row_number, record in records:
+            selected_symptoms = self.parse_batch_record(record)
+            results = self.diagnose(selected_symptoms) if selected_symptoms else []
+            scored.append({
+                'id': record.get(id_column, row_number),
+                'symptoms': selected_symptoms,
+                'diagnoses': [
+                    {
+                        'rank': rank,
+                        'code': result.code,
+                        'name': result.name,
+                        'confidence': result.confidence,
+                        'risk_level': result.risk_level
+                    }
+                    for rank, result in enumerate(results, 1)
+                ]
+            })
+        return scored
+
+    def update_consultation_stats(self, top_disease_name, selected_symptoms=None, timestamp=None):
         with self.stats_lock:
             try:
                 self.consultation_count += 1
-                self.disease_stats[top_disease_name] = self.disease_stats.get(top_disease_name, 0) + 1
+                if top_disease_name:
+                    self.disease_stats[top_disease_name] = self.disease_stats.get(top_disease_name, 0) + 1
+                self.rollups.record(timestamp or datetime.now(), top_disease_name, selected_symptoms or {})
+                self.sketches.record(selected_symptoms or {})
+                self.stats_dirty_seq += 1
+                sequence = self.stats_dirty_seq
                 
-                current_time = time.time()
-                if current_time - self.last_save_time >= self.save_interval:
-                    self.save_stats_safely()
-                    self.last_save_time = current_time
-                    print(f"📊 Stats saved: {self.consultation_count} consultations")
+                save_due = False
+                if self.durability_mode == 'periodic':
+                    current_time = time.time()
+                    if current_time - self.last_save_time >= self.save_interval:
+                        self.last_save_time = current_time
+                        save_due = True
                 
             except Exception as e:
                 print(f"ERROR updating stats: {e}")
+                return False
+
+        if save_due and self.flush_stats(fsync=False) and self.verbose:
+            print(f"📊 Stats saved: {self.consultation_count} consultations")
+
+        if self.durability_mode == 'group-commit':
+            # Menunggu di luar stats_lock agar request lain bisa masuk ke batch yang sama
+            # Waktu tunggu dibatasi: bila disk terus gagal (mis. penuh), request tidak tertahan selamanya
+            deadline = time.monotonic() + self.group_commit_timeout
+            with self.stats_commit_cond:
+                self.stats_commit_cond.notify_all()
+                while self.stats_durable_seq < sequence and not self.closed.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        print(f"❌ Group commit timeout: konsultasi #{sequence} belum tersimpan setelah {self.group_commit_timeout} detik")
+                        return False
+                    self.stats_commit_cond.wait(remaining)
+
+        if self.closed.is_set():
+            # Thread group-commit dan flush atexit sudah berhenti setelah close(), jadi simpan langsung
+            return self.flush_stats()
+        return True
+
+    def group_commit_loop(self):
+        while not self.closed.is_set():
+            with self.stats_commit_cond:
+                while self.stats_durable_seq >= self.stats_dirty_seq and not self.closed.is_set():
+                    self.stats_commit_cond.wait()
+            time.sleep(self.group_commit_delay)
+
+            if not self.flush_stats():
+                # Coba lagi pada putaran berikutnya; request tetap menunggu sampai tersimpan
+                time.sleep(1)
+
+    def flush_stats(self, fsync=True):
+        # Satu penulis pada satu waktu; snapshot diambil setelah kunci tulis agar file tidak pernah mundur
+        with self.stats_write_lock:
+            with self.stats_lock:
+                if self.stats_durable_seq >= self.stats_dirty_seq:
+                    return True
+                sequence = self.stats_dirty_seq
+                stats_data = self.stats_snapshot()
+            saved = self.write_stats_file(stats_data, fsync)
+            if saved and fsync and self.audit_store is not None:
+                # Jejak audit ditulis sebelum statistiknya dicatat, jadi ikut tersimpan oleh fsync batch yang sama
+                try:
+                    self.audit_store.sync()
+                except OSError as e:
+                    print(f"❌ Error syncing audit traces: {e}")
+                    saved = False
+            if saved:
+                with self.stats_commit_cond:
+                    self.stats_durable_seq = max(self.stats_durable_seq, sequence)
+                    self.stats_commit_cond.notify_all()
+        return saved
+
+    def replication_loop(self):
+        while not self.closed.wait(self.sync_interval):
+            self.sync_replicas()
+
+    def close(self):
+        # Dipanggil saat knowledge base dikeluarkan dari memori: simpan statistik dan hentikan thread latar
+        self.closed.set()
+        with self.stats_commit_cond:
+            self.stats_commit_cond.notify_all()
+        if self.group_commit_thread is not None:
+            self.group_commit_thread.join(self.group_commit_timeout)
+        self.flush_stats()
+        atexit.unregister(self.flush_stats)
+        if self.audit_store is not None:
+            self.audit_store.close()
+        if self.replicated:
+            self.sync_replicas()
+            atexit.unregister(self.sync_replicas)
+
+    def memory_footprint(self):
+        # Perkiraan: array numpy dihitung tepat, objek Python dari ukuran JSON-nya
+        arrays = [
+            self.cf_matrix, self.cf_presence,
+            self.sketches.combinations.table, self.sketches.cooccurrence.table, self.symptom_text_index.entry_norms
+        ] + list(self.symptom_text_index.postings.values()) + list(self.adaptive_tables or ())
+        size = sum(array.nbytes for array in arrays)
+        with self.stats_lock:
+            rollups_size = len(json.dumps(self.rollups.buckets, ensure_ascii=False))
+        size += 4 * (len(json.dumps([self.diseases, self.symptoms], ensure_ascii=False)) + rollups_size)
+        size += 4096 * len(self.diagnosis_cache)
+        return size
+
+    def sync_replicas(self):
+        # Ambil dulu lalu gabungkan, baru publikasikan: replika yang restart tanpa file lokal tidak menimpa hitungannya sendiri
+        try:
+            remote_states = self.stats_backend.fetch()
+        except Exception as e:
+            print(f"ERROR syncing replica stats: {e}")
+            return False
+
+        now = datetime.now()
+        with self.stats_lock:
+            view = dict(self.replica_view)
+            for node_id, state in remote_states.items():
+                view[node_id] = StatsBackend.join(view.get(node_id), StatsBackend.parse(state), now)
+            own_state = {
+                'consultation_count': self.consultation_count,
+                'disease_stats': dict(self.disease_stats),
+                'rollups': self.rollups.shared(now),
+                'sketches': self.sketches
+            }
+            own_remote = view.get(self.node_id)
+            if own_remote and own_remote['consultation_count'] > self.consultation_count:
+                own_state = StatsBackend.join(own_state, own_remote, now)
+                self.consultation_count = own_state['consultation_count']
+                self.disease_stats = own_state['disease_stats']
+                for granularity, buckets in own_state['rollups'].items():
+                    self.rollups.buckets[granularity].update(buckets)
+                self.sketches = own_state['sketches']
+                self.stats_dirty_seq += 1
+            self.replica_view = view
+            published = {
+                'consultation_count': own_state['consultation_count'],
+                'disease_stats': own_state['disease_stats'],
+                'rollups': own_state['rollups'],
+                'sketches': own_state['sketches'].to_dict(),
+                'last_updated': now.isoformat()
+            }
 
-    def save_stats_safely(self):
+        try:
+            self.stats_backend.publish(self.node_id, published)
+        except Exception as e:
+            print(f"ERROR syncing replica stats: {e}")
+            return False
+        return True
+
+    def global_stats(self):
+        with self.stats_lock:
+            view = dict(self.replica_view)
+            view[self.node_id] = {'consultation_count': self.consultation_count, 'disease_stats': dict(self.disease_stats)}
+        consultation_count = sum(state['consultation_count'] for state in view.values())
+        disease_stats = {}
+        for state in view.values():
+            for name, count in state['disease_stats'].items():
+                disease_stats[name] = disease_stats.get(name, 0) + count
+        return consultation_count, disease_stats, len(view)
+
+    def global_rollups(self, now):
+        # Rollup node ini dari memori, replika lain dari sinkronisasi terakhir; hanya jendela yang ditampilkan di tren
+        with self.stats_lock:
+            rollups = ConsultationRollups(self.rollups.shared(now))
+            others = [state['rollups'] for node_id, state in self.replica_view.items() if node_id != self.node_id]
+        for buckets in others:
+            rollups.add(buckets)
+        return rollups
+
+    def global_sketches(self):
+        with self.stats_lock:
+            sketches = SymptomSketches()
+            sketches.merge(self.sketches)
+            others = [state['sketches'] for node_id, state in self.replica_view.items() if node_id != self.node_id]
+        for other in others:
+            sketches.merge(other)
+        return sketches
 
-        stats_data = {
+    def stats_snapshot(self):
+        return {
             'consultation_count': self.consultation_count,
             'disease_stats': self.disease_stats.copy(), 
+            'rollups': self.rollups.to_dict(),
+            'sketches': self.sketches.to_dict(),
             'last_updated': datetime.now().isoformat(),
             'version': '2.0' 
         }
-        
+
+    def save_stats_safely(self, fsync=False):
+        return self.write_stats_file(self.stats_snapshot(), fsync)
+
+    def write_stats_file(self, stats_data, fsync=False):
         temp_file = self.stats_file + '.tmp'
         backup_file = self.stats_file + '.backup'
         
@@ -418,13 +2364,24 @@ class EarDiagnosisSystem:
             
             with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(stats_data, f, ensure_ascii=False, indent=2)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
             
             if os.path.exists(temp_file):
                 if os.name == 'nt': 
                     if os.path.exists(self.stats_file):
                         os.remove(self.stats_file)
                 os.rename(temp_file, self.stats_file)
-                
+                if fsync and os.name != 'nt':
+                    # fsync direktori agar rename ikut durable
+                    dir_fd = os.open(os.path.dirname(os.path.abspath(self.stats_file)), os.O_RDONLY)
+                    try:
+                        os.fsync(dir_fd)
+                    finally:
+                        os.close(dir_fd)
+            
+            self.stats_writes += 1
             return True
             
         except Exception as e:
@@ -463,6 +2420,8 @@ class EarDiagnosisSystem:
                         if isinstance(stats, dict):
                             self.consultation_count = stats.get('consultation_count', 0)
                             self.disease_stats = stats.get('disease_stats', {})
+                            self.rollups = ConsultationRollups(stats.get('rollups'))
+                            self.sketches = SymptomSketches(stats.get('sketches'))
                             
                             if not isinstance(self.consultation_count, int):
                                 self.consultation_count = 0
@@ -479,115 +2438,505 @@ class EarDiagnosisSystem:
         print("📊 Using default stats (no valid file found)")
         self.consultation_count = 0
         self.disease_stats = {}
+        self.rollups = ConsultationRollups()
+        self.sketches = SymptomSketches()
         return False
 
+    def compile_rules(self):
+        rules = [Rule.from_dict(rule) for rule in self.inference_rules]
+        base_facts = set(self.symptoms.keys())
+
+        # 1. Fakta yang dapat dicapai: gejala + kesimpulan aturan yang kondisinya dapat dipenuhi
+        reachable_facts = set(base_facts)
+        reachable = set()
+        changed = True
+        while changed:
+            changed = False
+            for index, rule in enumerate(rules):
+                if index not in reachable and all(condition in reachable_facts for condition in rule.conditions):
+                    reachable.add(index)
+                    reachable_facts.add(rule.conclusion)
+                    changed = True
+
+        unreachable = []
+        for index, rule in enumerate(rules):
+            if index not in reachable:
+                missing = [condition for condition in rule.conditions if condition not in reachable_facts]
+                unreachable.append({'id': rule.id, 'missing': missing})
+
+        # Target diperiksa untuk semua aturan, termasuk yang tidak pernah bisa aktif
+        unknown_targets = [
+            {'id': rule.id, 'target_disease': rule.target_disease}
+            for rule in rules
+            if rule.target_disease and rule.target_disease not in self.diseases
+        ]
+
+        # 2. Graf dependensi: aturan produsen -> aturan yang memakai kesimpulannya
+        producers = {}
+        for index in reachable:
+            producers.setdefault(rules[index].conclusion, []).append(index)
+
+        dependencies = {index: set() for index in reachable}
+        dependents = {index: set() for index in reachable}
+        for index in reachable:
+            for condition in rules[index].conditions:
+                for producer in producers.get(condition, []):
+                    if producer != index:
+                        dependencies[index].add(producer)
+                        dependents[producer].add(index)
+
+        # 3. Stratifikasi topologis (Kahn), urutan asli dipakai sebagai pemecah seri
+        import heapq
+        remaining = {index: len(deps) for index, deps in dependencies.items()}
+        level = {index: 0 for index in reachable}
+        ready = [index for index, count in remaining.items() if count == 0]
+        heapq.heapify(ready)
+        ordered = []
+        while ready:
+            index = heapq.heappop(ready)
+            ordered.append(index)
+            for dependent in dependents[index]:
+                level[dependent] = max(level[dependent], level[index] + 1)
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, dependent)
+
+        strata = []
+        for index in ordered:
+            while len(strata) <= level[index]:
+                strata.append([])
+            strata[level[index]].append(rules[index])
+
+        # Aturan yang tersisa berada di (atau bergantung pada) siklus
+        cyclic = sorted(index for index in reachable if index not in set(ordered))
+
+        self.rule_strata = strata
+        self.cyclic_rules = [rules[index] for index in cyclic]
+
+        # Indeks untuk backward chaining, mengikuti urutan eksekusi forward chaining
+        self.rules_by_conclusion = {}
+        self.rules_by_target = {}
+        for rule in [rule for stratum in strata for rule in stratum] + self.cyclic_rules:
+            self.rules_by_conclusion.setdefault(rule.conclusion, []).append(rule)
+            self.rules_by_target.setdefault(rule.target_disease, []).append(rule)
+        self.rule_diagnostics = {
+            'total': len(rules),
+            'active': len(ordered) + len(cyclic),
+            'strata': [[rule.id for rule in stratum] for stratum in strata],
+            'unreachable': unreachable,
+            'unknown_targets': unknown_targets,
+            'cycles': [rules[index].id for index in cyclic]
+        }
+        return self.rule_diagnostics
+
+    def prepare_scoring_tables(self):
+        # Teks gejala/penyakit di-intern agar knowledge base lain yang memakai teks sama berbagi objek string
+        self.symptoms = {sys.intern(code): sys.intern(desc) for code, desc in self.symptoms.items()}
+        for disease in self.diseases.values():
+            if isinstance(disease.get('symptoms'), dict):
+                disease['name'] = sys.intern(disease['name'])
+                disease['symptoms'] = {sys.intern(code): cf for code, cf in disease['symptoms'].items()}
+
+        self.symptom_models = {code: Symptom(code, desc) for code, desc in self.symptoms.items()}
+        self.disease_models = {}
+        for code, disease in self.diseases.items():
+            if not isinstance(disease.get('symptoms'), dict):
+                print(f"❌ SKIP {code}: Invalid symptoms structure")
+                continue
+            self.disease_models[sys.intern(code)] = Disease.from_dict(code, disease)
+
+        self.matrix_disease_codes = list(self.disease_models.keys())
+        self.matrix_symptom_codes = list(self.symptoms.keys())
+
+        if self.compiled_tables_pending and len(self.matrix_disease_codes) == self.compiled_kb.n_diseases:
+            # Matriks CF langsung dari array CSR di mmap; hanya berlaku sekali, perubahan berikutnya dibangun dari dict
+            registered = self.compiled_kb.registered_symptoms()
+            self.matrix_disease_codes = [sys.intern(code) for code in self.compiled_kb.disease_codes()]
+            self.matrix_symptom_codes = [
+                sys.intern(code) for code, is_registered in zip(self.compiled_kb.symptom_codes(), registered) if is_registered
+            ]
+            weights = self.compiled_kb.dense_cf_matrix()[:, registered]
+            presence = self.compiled_kb.cf_presence_matrix()[:, registered]
+        else:
+            symptom_index = {code: i for i, code in enumerate(self.matrix_symptom_codes)}
+            weights = np.zeros((len(self.matrix_disease_codes), len(self.matrix_symptom_codes)))
+            presence = np.zeros(weights.shape, dtype=bool)
+            for row, code in enumerate(self.matrix_disease_codes):
+                for symptom_code, base_cf in self.diseases[code]['symptoms'].items():
+                    if symptom_code in symptom_index:
+                        weights[row, symptom_index[symptom_code]] = float(base_cf)
+                        presence[row, symptom_index[symptom_code]] = True
+        self.compiled_tables_pending = False
+        self.cf_matrix = weights
+        self.cf_presence = presence
+
+        # Tabel konsultasi adaptif baru dibangun saat sesi adaptif pertama dimulai
+        self.adaptive_tables = None
+
+        self.symptom_text_index = SymptomTextIndex(self.symptoms, self.symptom_synonyms)
+
+        # Versi knowledge base untuk jejak audit; posisi kode dipakai sebagai ID ringkas di rekaman biner
+        snapshot = json.dumps(self.kb_snapshot(), sort_keys=True, ensure_ascii=False)
+        self.kb_version = hashlib.blake2b(snapshot.encode('utf-8'), digest_size=8).digest()
+        self.symptom_positions = {code: i for i, code in enumerate(self.matrix_symptom_codes)}
+        self.disease_positions = {code: i for i, code in enumerate(self.matrix_disease_codes)}
+        self.rule_positions = {rule['id']: i for i, rule in enumerate(self.inference_rules)}
+        self.severity_positions = {severity: i for i, severity in enumerate(self.severity_multipliers)}
+
+        # Tabel turunan berubah, jadi hasil dan halaman yang sudah dirender tidak berlaku lagi
+        self.diagnosis_cache = OrderedDict()
+        self.catalogue_pages = {}
+
+    def cached_diagnosis(self, selected_symptoms):
+        key = SymptomSketches.combination_key(selected_symptoms)
+        with self.cache_lock:
+            cached = self.diagnosis_cache.get(key)
+            if cached is not None:
+                self.diagnosis_cache.move_to_end(key)
+                return cached
+
+        results = self.diagnose(selected_symptoms)
+        cached = (results, self.format_results(selected_symptoms, results))
+        with self.cache_lock:
+            self.diagnosis_cache[key] = cached
+            while len(self.diagnosis_cache) > self.diagnosis_cache_size:
+                self.diagnosis_cache.popitem(last=False)
+        return cached
+
+    def warm_up(self, limit=32):
+        start_time = time.time()
+        self.get_symptoms_list()
+        self.get_diseases_list()
+
+        warmed = 0
+        with self.stats_lock:
+            frequent = self.sketches.combinations.most_common(limit)
+
+        verbose, self.verbose = self.verbose, False
+        try:
+            for key, _ in frequent:
+                selected_symptoms = SymptomSketches.parse_combination_key(key)
+                if selected_symptoms and all(
+                    code in self.symptoms and severity in self.severity_multipliers
+                    for code, severity in selected_symptoms.items()
+                ):
+                    self.cached_diagnosis(selected_symptoms)
+                    warmed += 1
+        finally:
+            self.verbose = verbose
+
+        print(f"🔥 Warm-up selesai: {warmed} kombinasi tersering di-cache, {len(self.catalogue_pages)} halaman katalog dirender ({time.time() - start_time:.2f} detik)")
+        return warmed
+
+    @staticmethod
+    def binary_entropy(p):
+        p = np.clip(p, 1e-12, 1.0 - 1e-12)
+        return -(p * np.log2(p) + (1.0 - p) * np.log2(1.0 - p))
+
+    def get_adaptive_tables(self):
+        # Hanya pasangan (penyakit, gejala) yang dimiliki penyakit disimpan, urut per penyakit (CSR);
+        # pasangan lain tepat di batas bawah sehingga cukup disimpan selisihnya terhadap batas
+        tables = self.adaptive_tables
+        if tables is None:
+            rows, columns = np.nonzero(self.cf_presence)
+            likelihood = np.clip(self.cf_matrix[rows, columns], self.adaptive_floor, 1.0 - self.adaptive_floor)
+            indptr = np.searchsorted(rows, np.arange(len(self.matrix_disease_codes) + 1)).astype(np.int32)
+            tables = (
+                indptr,
+                rows.astype(np.int32),
+                columns.astype(np.int32),
+                likelihood - self.adaptive_floor,
+                self.binary_entropy(likelihood) - self.binary_entropy(self.adaptive_floor)
+            )
+            self.adaptive_tables = tables
+        return tables
+
+    def adaptive_symptom_mass(self, row_weights, rows=None):
+        # Σ_d w_d·P(ya|d) dan Σ_d w_d·H(ya|d) per gejala, hanya dari baris `rows` (default semua penyakit)
+        indptr, pair_rows, columns, yes_excess, entropy_excess = self.get_adaptive_tables()
+        if rows is None:
+            pairs = slice(None)
+            pair_weights = row_weights[pair_rows]
+        else:
+            counts = indptr[rows + 1] - indptr[rows]
+            pairs = np.arange(counts.sum()) + np.repeat(indptr[rows] - (np.cumsum(counts) - counts), counts)
+            pair_weights = np.repeat(row_weights, counts)
+        n_symptoms = len(self.matrix_symptom_codes)
+        total = row_weights.sum()
+        yes_mass = total * self.adaptive_floor + np.bincount(
+            columns[pairs], weights=pair_weights * yes_excess[pairs], minlength=n_symptoms
+        )
+        answer_entropy = total * self.binary_entropy(self.adaptive_floor) + np.bincount(
+            columns[pairs], weights=pair_weights * entropy_excess[pairs], minlength=n_symptoms
+        )
+        return yes_mass, answer_entropy
+
+    def start_adaptive_session(self):
+        # Prior dari riwayat diagnosis (dengan smoothing) agar penyakit yang sering muncul ditanyakan lebih dulu
+        disease_stats = self.global_stats()[1]
+        prior = np.array([
+            disease_stats.get(self.disease_models[code].name, 0) + 1.0
+            for code in self.matrix_disease_codes
+        ])
+        posterior = prior / prior.sum()
+        # Per gejala: P(jawaban ya) = Σ P(d)·P(ya|d) dan H(jawaban | penyakit) = Σ P(d)·H(ya|d);
+        # keduanya disimpan di sesi dan hanya diperbarui untuk penyakit yang berubah setelah tiap jawaban
+        yes_mass, answer_entropy = self.adaptive_symptom_mass(posterior)
+        return {
+            'kb_name': self.kb_name,
+            'kb_version': self.kb_version,
+            'answers': {},
+            'log_posterior': np.log(posterior),
+            'yes_mass': yes_mass,
+            'answer_entropy': answer_entropy,
+            'last_question': None
+        }
+
+    def adaptive_posterior(self, session):
+        log_posterior = session['log_posterior']
+        posterior = np.exp(log_posterior - log_posterior.max())
+        return posterior / posterior.sum()
+
+    def answer_adaptive_question(self, session, symptom_code, severity):
+        column = self.symptom_positions[symptom_code]
+        session['answers'][symptom_code] = severity
+        likelihood = np.clip(self.cf_matrix[:, column], self.adaptive_floor, 1.0 - self.adaptive_floor)
+        # Penyakit dengan peluang di batas bawah dikali faktor yang sama dan hilang saat normalisasi,
+        # jadi hanya baris yang berbeda dari batas yang perlu diperbarui
+        if severity:
+            ratio = np.log(likelihood / self.adaptive_floor)
+        else:
+            ratio = np.log((1.0 - likelihood) / (1.0 - self.adaptive_floor))
+        changed = np.flatnonzero(ratio)
+
+        log_posterior = session['log_posterior'].copy()
+        old_weights = np.exp(log_posterior[changed])
+        log_posterior[changed] += ratio[changed]
+        weight_change = np.exp(log_posterior[changed]) - old_weights
+        total = 1.0 + weight_change.sum()
+
+        yes_change, entropy_change = self.adaptive_symptom_mass(weight_change, changed)
+        session['log_posterior'] = log_posterior - np.log(total)
+        session['yes_mass'] = (session['yes_mass'] + yes_change) / total
+        session['answer_entropy'] = (session['answer_entropy'] + entropy_change) / total
+        return session
+
+    def next_adaptive_question(self, session, confidence_threshold=0.9, max_questions=8):
+        posterior = self.adaptive_posterior(session)
+        if posterior.max() >= confidence_threshold or len(session['answers']) >= max_questions:
+            return None, 0.0
+
+        # Information gain semua gejala sekaligus: I(D; jawaban) = H(jawaban) - H(jawaban | D)
+        information_gain = self.binary_entropy(session['yes_mass']) - session['answer_entropy']
+        for code in session['answers']:
+            information_gain[self.symptom_positions[code]] = -np.inf
+
+        best = int(np.argmax(information_gain))
+        if information_gain[best] < 1e-3:
+            return None, 0.0
+        return self.matrix_symptom_codes[best], float(information_gain[best])
+
+    def get_adaptive_candidates(self, session, limit=3):
+        posterior = self.adaptive_posterior(session)
+        order = np.argsort(-posterior)[:limit]
+        text = "### 📊 Kandidat Saat Ini\n"
+        for i in order:
+            code = self.matrix_disease_codes[i]
+            text += f"- **{self.disease_models[code].name}**: {posterior[i] * 100:.1f}%\n"
+        return text
+
+    def process_adaptive_step(self, answer, session):
+        # Sesi dari knowledge base lain (setelah berganti pilihan) atau dari versi sebelum diubah tidak bisa dilanjutkan
+        if (
+            session is None or answer == "__mulai__" or session.get('kb_name') != self.kb_name
+            or session.get('kb_version') != self.kb_version
+        ):
+            session = self.start_adaptive_session()
+        elif session.get('last_question'):
+            severity = None if not answer or answer == "tidak" else answer
+            self.answer_adaptive_question(session, session['last_question'], severity)
+
+        question, information_gain = self.next_adaptive_question(session)
+        session['last_question'] = question
+        asked = len(session['answers'])
+
+        if question is not None:
+            question_text = f"## ❓ Pertanyaan {asked + 1}\n\n"
+            question_text += f"Apakah Anda mengalami: **{self.symptoms[question]}** ({question})?\n\n"
+            question_text += f"*Nilai informasi pertanyaan ini: {information_gain:.2f} bit*\n\n"
+            question_text += self.get_adaptive_candidates(session)
+            return question_text, session, ""
+
+        selected_symptoms = {code: severity for code, severity in session['answers'].items() if severity}
+        question_text = f"## ✅ Konsultasi selesai setelah {asked} pertanyaan\n\n"
+        question_text += self.get_adaptive_candidates(session)
+
+        if not selected_symptoms:
+            return question_text, session, "# 🤔 Hasil Diagnosis\n\n**Tidak ada gejala yang dilaporkan.**\n\nJika Anda tetap merasa tidak nyaman, konsultasikan dengan dokter."
+
+        results = self.diagnose(selected_symptoms)
+        consultation_id = self.record_audit_trace(selected_symptoms, results)
+        self.update_consultation_stats(results[0].name if results else None, selected_symptoms)
+        _, diagnosis_text, _ = self.format_results(selected_symptoms, results)
+        if consultation_id is not None:
+            diagnosis_text = f"🧾 **ID Konsultasi:** #{consultation_id}\n\n" + diagnosis_text
+        return question_text, session, diagnosis_text
+
+    def what_if_analysis(self, selected_symptoms, chunk_size=256):
+        severities = list(self.severity_multipliers.keys())
+        n_symptoms = len(self.matrix_symptom_codes)
+
+        current_multiplier = np.zeros(n_symptoms)
+        selected_mask = np.zeros(n_symptoms, dtype=bool)
+        for code, severity in selected_symptoms.items():
+            if code in self.symptom_positions:
+                current_multiplier[self.symptom_positions[code]] = self.severity_multipliers.get(severity, 0.5)
+                selected_mask[self.symptom_positions[code]] = True
+
+        # CF gabungan = 1 - Π(1 - cf_i); hanya gejala terpilih yang faktornya bukan 1
+        selected_columns = np.flatnonzero(selected_mask)
+        factors = 1.0 - self.cf_matrix[:, selected_columns] * current_multiplier[selected_columns]
+        baseline = 1.0 - factors.prod(axis=1)
+        matched = self.cf_presence[:, selected_columns].sum(axis=1)
+
+        # Produk semua faktor kecuali gejala s = produk / faktor s; faktor nol (CF 1.0) dihitung terpisah
+        zero_factors = (factors == 0).sum(axis=1)
+        nonzero_product = np.where(factors == 0, 1.0, factors).prod(axis=1)
+
+        # Varian: setiap tingkat keparahan, ditambah indeks terakhir = gejala dihapus / tidak dipilih
+        multipliers = np.append([self.severity_multipliers[severity] for severity in severities], 0.0)
+        impact = np.zeros(n_symptoms)
+        impact_disease = np.zeros(n_symptoms, dtype=np.int64)
+        impact_variant = np.zeros(n_symptoms, dtype=np.int64)
+        impact_cf = np.zeros(n_symptoms)
+
+        # Gejala diproses per blok, hanya pasangan (penyakit, gejala) yang memang memiliki gejalanya (CF lain tidak berubah),
+        # jadi memori puncak O(penyakit × chunk_size) dan hanya perubahan terbesar per gejala yang disimpan
+        for start in range(0, n_symptoms, chunk_size):
+            columns, rows = np.nonzero(self.cf_presence[:, start:start + chunk_size].T)
+            if not len(rows):
+                continue
+            columns += start
+            weights = self.cf_matrix[rows, columns]
+            own_factors = 1.0 - weights * current_multiplier[columns]
+            other_zeros = zero_factors[rows] - (own_factors == 0)
+            exclusive = np.where(
+                other_zeros > 0, 0.0, nonzero_product[rows] / np.where(own_factors == 0, 1.0, own_factors)
+            )
+
+            best_delta = np.full(len(rows), -1.0)
+            best_variant = np.zeros(len(rows), dtype=np.int64)
+            best_cf = np.zeros(len(rows))
+            for k, multiplier in enumerate(multipliers):
+                variants = 1.0 - exclusive * (1.0 - weights * multiplier)
+                delta = np.abs(variants - baseline[rows])
+                better = delta > best_delta
+                best_delta[better] = delta[better]
+                best_variant[better] = k
+                best_cf[better] = variants[better]
+
+            # Satu baris per gejala: perubahan terbesar, seri dimenangkan penyakit yang lebih awal
+            order = np.lexsort((rows, -best_delta, columns))
+            picks = order[np.unique(columns[order], return_index=True)[1]]
+            targets = columns[picks]
+            impact[targets] = best_delta[picks]
+            impact_disease[targets] = rows[picks]
+            impact_variant[targets] = best_variant[picks]
+            impact_cf[targets] = best_cf[picks]
+
+        return {
+            'diseases': self.matrix_disease_codes,
+            'symptoms': self.matrix_symptom_codes,
+            'severities': severities + [None],
+            'selected': selected_mask,
+            'baseline': baseline * 100,
+            'baseline_qualifies': (baseline * 100 >= 40.0) & (matched > 0),
+            'impact': impact * 100,
+            'impact_disease': impact_disease,
+            'impact_severity': impact_variant,
+            'impact_cf': impact_cf * 100
+        }
+
+    def get_what_if_report(self, selected_symptoms, limit=5):
+        analysis = self.what_if_analysis(selected_symptoms)
+        baseline = analysis['baseline']
+        impact = analysis['impact']
+
+        text = "# 🔬 Analisis What-If\n\n"
+        text += "Perubahan CF terbesar jika satu gejala ditambahkan, dihapus, atau diubah tingkat keparahannya:\n\n"
+        text += "| Gejala | Status | Perubahan | Penyakit Terdampak | CF Saat Ini → Baru |\n|---|---|---|---|---|\n"
+
+        # Dibulatkan agar dampak yang sama (beda hanya pembulatan float) diurutkan menurut kode gejala
+        order = np.argsort(-np.round(impact, 9), kind='stable')
+        for s in order[:limit]:
+            if impact[s] < 0.05:
+                break
+            d = analysis['impact_disease'][s]
+            code = analysis['symptoms'][s]
+            severity = analysis['severities'][analysis['impact_severity'][s]]
+            status = "dipilih" if analysis['selected'][s] else "belum dipilih"
+            change = "hapus" if severity is None else self.severity_labels.get(severity, severity)
+            disease_name = self.disease_models[analysis['diseases'][d]].name
+            text += f"| **{code}**: {self.symptoms.get(code, 'Unknown')} | {status} | {change} | {disease_name} | {baseline[d]:.1f}% → {analysis['impact_cf'][s]:.1f}% |\n"
+
+        unanswered = [s for s in order if not analysis['selected'][s] and impact[s] >= 0.05]
+        if unanswered:
+            code = analysis['symptoms'][unanswered[0]]
+            text += f"\n💡 **Gejala belum dipilih yang paling berpengaruh**: {code} - {self.symptoms.get(code, 'Unknown')}\n"
+
+        return text
+
+    def process_what_if(self, payload):
+        try:
+            selected_symptoms = self.parse_symptom_inputs(payload)
+        except (IndexError, TypeError, ValueError) as e:
+            print(f"ERROR: Argument parsing failed - {e}")
+            return "❌ **Terjadi kesalahan dalam memproses input!**\n\nSilakan refresh halaman dan coba lagi."
+
+        return self.get_what_if_report(selected_symptoms)
+
+    def get_rule_report(self):
+        diagnostics = self.rule_diagnostics
+        report = f"🧩 Aturan: {diagnostics['active']} aktif dari {diagnostics['total']}, {len(diagnostics['strata'])} strata\n"
+        for level, rule_ids in enumerate(diagnostics['strata']):
+            report += f"   Strata {level}: {', '.join(rule_ids)}\n"
+        for rule in diagnostics['unreachable']:
+            report += f"   ⚠️ {rule['id']} tidak pernah terpicu: kondisi tidak dikenal {', '.join(rule['missing'])}\n"
+        for rule in diagnostics['unknown_targets']:
+            report += f"   ⚠️ {rule['id']} menargetkan penyakit yang tidak ada: {rule['target_disease']}\n"
+        if diagnostics['cycles']:
+            report += f"   🔁 Siklus terdeteksi pada: {', '.join(diagnostics['cycles'])}\n"
+        return report
+
     def forward_chaining_inference(self, selected_symptoms):
         working_memory = set(selected_symptoms.keys())
         fired_rules = []
-        
-        inference_rules = [
-            {
-                'id': 'R01',
-                'name': 'Deteksi Pola Infeksi',
-                'conditions': ['G01', 'G03', 'G07'], 
-                'conclusion': 'INFECTION_PATTERN',
-                'cf': 0.8,
-                'target_disease': 'P02', 
-                'description': 'Pola gejala menunjukkan kemungkinan infeksi telinga'
-            },
-            
-            {
-                'id': 'R02',
-                'name': 'Deteksi Pola Sumbatan',
-                'conditions': ['G11', 'G12', 'G10'],
-                'conclusion': 'BLOCKAGE_PATTERN',
-                'cf': 0.7,
-                'target_disease': 'P03',
-                'description': 'Pola gejala menunjukkan kemungkinan sumbatan telinga'
-            },
-            
-            {
-                'id': 'R03', 
-                'name': 'Deteksi Pola Vertigo',
-                'conditions': ['G9', 'G10', 'G5'],  
-                'conclusion': 'VERTIGO_PATTERN',
-                'cf': 0.9,
-                'target_disease': 'P05', 
-                'description': 'Pola gejala menunjukkan kemungkinan gangguan keseimbangan'
-            },
-            
-            {
-                'id': 'R04',
-                'name': 'Deteksi Infeksi Eksternal',
-                'conditions': ['G02', 'G04', 'G05'], 
-                'conclusion': 'EXTERNAL_INFECTION_PATTERN', 
-                'cf': 0.75,
-                'target_disease': 'P01', 
-                'description': 'Pola gejala menunjukkan kemungkinan infeksi telinga luar'
-            },
-            
-            {
-                'id': 'R05',
-                'name': 'Deteksi Pola Tinnitus',
-                'conditions': ['G15', 'G17'], 
-                'conclusion': 'TINNITUS_PATTERN',
-                'cf': 0.8,
-                'target_disease': 'P04', 
-                'description': 'Pola gejala menunjukkan kemungkinan tinnitus'
-            },
-            
-            {
-                'id': 'R06',
-                'name': 'Deteksi Pola Tekanan',
-                'conditions': ['G06', 'G13'], 
-                'conclusion': 'PRESSURE_PATTERN',
-                'cf': 0.6,
-                'target_disease': 'P06', 
-                'description': 'Pola gejala menunjukkan kemungkinan trauma tekanan'
-            },
-            
-            {
-                'id': 'R07',
-                'name': 'Infeksi Kompleks',
-                'conditions': ['INFECTION_PATTERN', 'G04'], 
-                'conclusion': 'COMPLEX_INFECTION',
-                'cf': 0.9,
-                'target_disease': 'P02',
-                'description': 'Infeksi dengan komplikasi'
-            }
-        ]
-        
-        max_iterations = 10 
-        iteration = 0
-        
-        while iteration < max_iterations:
-            iteration += 1
+
+        # Satu kali jalan sesuai urutan strata: semua premis sudah final saat aturan dievaluasi
+        for stratum in self.rule_strata:
+            for rule in stratum:
+                if rule.conclusion not in working_memory and all(condition in working_memory for condition in rule.conditions):
+                    working_memory.add(rule.conclusion)
+                    fired_rules.append(rule)
+
+                    if self.verbose:
+                        print(f"   🔥 RULE FIRED: {rule.id} - {rule.name}")
+                        print(f"      Conditions: {rule.conditions} → {rule.conclusion}")
+
+        # Aturan siklik dievaluasi sampai titik tetap; setiap putaran menambah minimal satu fakta
+        new_facts_added = bool(self.cyclic_rules)
+        while new_facts_added:
             new_facts_added = False
-            
-            print(f"   Forward Chaining Iteration {iteration}")
-            print(f"   Working Memory: {working_memory}")
-            
-            for rule in inference_rules:
-                if any(fired['id'] == rule['id'] for fired in fired_rules):
-                    continue
-                
-                conditions_met = all(condition in working_memory for condition in rule['conditions'])
-                
-                if conditions_met and rule['conclusion'] not in working_memory:
-                    working_memory.add(rule['conclusion'])
-                    fired_rules.append(rule.copy())
+            for rule in self.cyclic_rules:
+                if rule.conclusion not in working_memory and all(condition in working_memory for condition in rule.conditions):
+                    working_memory.add(rule.conclusion)
+                    fired_rules.append(rule)
                     new_facts_added = True
-                    
-                    print(f"   🔥 RULE FIRED: {rule['id']} - {rule['name']}")
-                    print(f"      Conditions: {rule['conditions']} → {rule['conclusion']}")
-            
-            if not new_facts_added:
-                print(f"   ✅ Forward chaining completed after {iteration} iterations")
-                break
-        
-        print(f"   Final working memory: {working_memory}")
-        print(f"   Total rules fired: {len(fired_rules)}")
-        
+
+        if self.verbose:
+            print(f"   Final working memory: {working_memory}")
+            print(f"   Total rules fired: {len(fired_rules)}")
+
         return working_memory, fired_rules
 
 
@@ -600,11 +2949,11 @@ class EarDiagnosisSystem:
         explanation += "Sistem menggunakan forward chaining untuk menarik kesimpulan dari gejala:\n\n"
         
         for rule in fired_rules:
-            explanation += f"**{rule['id']} - {rule['name']}**\n"
-            explanation += f"- Kondisi: {', '.join(rule['conditions'])}\n"
-            explanation += f"- Kesimpulan: {rule['conclusion']}\n"
-            explanation += f"- CF: {rule['cf']}\n"
-            explanation += f"- Deskripsi: {rule['description']}\n\n"
+            explanation += f"**{rule.id} - {rule.name}**\n"
+            explanation += f"- Kondisi: {', '.join(rule.conditions)}\n"
+            explanation += f"- Kesimpulan: {rule.conclusion}\n"
+            explanation += f"- CF: {rule.cf}\n"
+            explanation += f"- Deskripsi: {rule.description}\n\n"
         
         return explanation
 
@@ -615,24 +2964,25 @@ class EarDiagnosisSystem:
             return 0.0
         
         cf_combined = 0.0
-        processed_symptoms = []
         
-        for symptom_code, base_cf in disease_symptoms.items():
+        for symptom_code, base_cf in disease_symptoms:
             if symptom_code in selected_symptoms:
                 severity = selected_symptoms[symptom_code]
                 severity_multiplier = self.severity_multipliers.get(severity, 0.5)
                 
-                cf_symptom = float(base_cf) * float(severity_multiplier)
+                cf_symptom = base_cf * severity_multiplier
 
-                print(f"   📊 {symptom_code}:")
-                print(f"      Base CF: {base_cf} (type: {type(base_cf)})")
-                print(f"      Severity: '{severity}' -> Multiplier: {severity_multiplier} (type: {type(severity_multiplier)})")
-                print(f"      Calculation: {base_cf} × {severity_multiplier} = {cf_symptom}")
-                print(f"      Manual check: {float(base_cf) * float(severity_multiplier)}")
+                if self.verbose:
+                    print(f"   📊 {symptom_code}:")
+                    print(f"      Base CF: {base_cf} (type: {type(base_cf)})")
+                    print(f"      Severity: '{severity}' -> Multiplier: {severity_multiplier} (type: {type(severity_multiplier)})")
+                    print(f"      Calculation: {base_cf} × {severity_multiplier} = {cf_symptom}")
+                    print(f"      Manual check: {base_cf * severity_multiplier}")
                     
                 if inferred_facts and symptom_code in inferred_facts:
                     cf_symptom = min(1.0, cf_symptom)
-                    print(f"      With inference boost: {cf_symptom}")
+                    if self.verbose:
+                        print(f"      With inference boost: {cf_symptom}")
                 
                 cf_previous = cf_combined
                 if cf_combined == 0.0:
@@ -641,25 +2991,20 @@ class EarDiagnosisSystem:
                     # CF combining rule: CF1 + CF2 * (1 - CF1)
                     cf_combined = cf_combined + cf_symptom * (1 - cf_combined)
 
-                print(f"      CF before combining: {cf_previous}")
-                print(f"      CF after combining: {cf_combined}")
-                print(f"      Combining formula: {cf_previous} + {cf_symptom} × (1 - {cf_previous}) = {cf_combined}")
-                
-                processed_symptoms.append({
-                    'code': symptom_code,
-                    'base_cf': base_cf,
-                    'severity': severity,
-                    'multiplier': severity_multiplier,
-                    'final_cf': cf_symptom
-                })
+                if self.verbose:
+                    print(f"      CF before combining: {cf_previous}")
+                    print(f"      CF after combining: {cf_combined}")
+                    print(f"      Combining formula: {cf_previous} + {cf_symptom} × (1 - {cf_previous}) = {cf_combined}")
                 
-                print(f"      Symptom {symptom_code}: {base_cf} × {severity_multiplier} = {cf_symptom:.3f} (CF gejala)")
-                print(f"      Combined CF so far: {cf_combined:.3f} (gabungan hingga gejala ini)")
+                if self.verbose:
+                    print(f"      Symptom {symptom_code}: {base_cf} × {severity_multiplier} = {cf_symptom:.3f} (CF gejala)")
+                    print(f"      Combined CF so far: {cf_combined:.3f} (gabungan hingga gejala ini)")
 
         
         confidence_percentage = cf_combined * 100
         
-        print(f"   FINAL CF: {cf_combined:.3f} = {confidence_percentage:.1f}%")
+        if self.verbose:
+            print(f"   FINAL CF: {cf_combined:.3f} = {confidence_percentage:.1f}%")
         
         return confidence_percentage
 
@@ -687,7 +3032,7 @@ class EarDiagnosisSystem:
     
     def calculate_diagnosis_score(self, result):
 
-        return result['confidence']
+        return result.confidence
 
     def format_enhanced_results(self, selected_symptoms, results, fired_rules):
 
@@ -732,24 +3077,24 @@ class EarDiagnosisSystem:
 
         for i, result in enumerate(results):
             rank_emoji = "🏆" if i == 0 else f"#{i+1}"
-            confidence_emoji = "🔴" if result['confidence'] >= 80 else "🟡" if result['confidence'] >= 60 else "🟢"
+            confidence_emoji = "🔴" if result.confidence >= 80 else "🟡" if result.confidence >= 60 else "🟢"
 
-            diagnosis_text += f"## {rank_emoji} {result['name']}\n"
-            diagnosis_text += f"{confidence_emoji} **Confidence Factor (CF):** {result['confidence']}%\n"
-            diagnosis_text += f"🎯 **Gejala Cocok:** {result['matched_count']} dari {result['total_symptoms']} gejala ({result['match_ratio']}%)\n"
-            diagnosis_text += f"🔥 **Skor Gabungan:** {result.get('diagnosis_score', 0):.1f} / 100\n"
-            diagnosis_text += f"⚠️ **Tingkat Keparahan Penyakit:** {result['severity']}\n\n"
+            diagnosis_text += f"## {rank_emoji} {result.name}\n"
+            diagnosis_text += f"{confidence_emoji} **Confidence Factor (CF):** {result.confidence}%\n"
+            diagnosis_text += f"🎯 **Gejala Cocok:** {result.matched_count} dari {result.total_symptoms} gejala ({result.match_ratio}%)\n"
+            diagnosis_text += f"🔥 **Skor Gabungan:** {self.calculate_diagnosis_score(result):.1f} / 100\n"
+            diagnosis_text += f"⚠️ **Tingkat Keparahan Penyakit:** {result.severity}\n\n"
 
 
-            diagnosis_text += f"**📖 Deskripsi**: {result['info']}\n\n"
-            diagnosis_text += f"**⚠️ Tingkat Keparahan**: {result['severity']}\n\n"
-            diagnosis_text += f"**⏱️ Durasi Biasanya**: {result['duration']}\n\n"
+            diagnosis_text += f"**📖 Deskripsi**: {result.info}\n\n"
+            diagnosis_text += f"**⚠️ Tingkat Keparahan**: {result.severity}\n\n"
+            diagnosis_text += f"**⏱️ Durasi Biasanya**: {result.duration}\n\n"
 
             diagnosis_text += "### ✅ Gejala yang Cocok:\n"
 
-            for code in result['matching_symptoms']:
+            for code in result.matching_symptoms:
                 name = self.symptoms.get(code, "Unknown")
-                base_cf = self.diseases[result['code']]['symptoms'].get(code, 0)
+                base_cf = self.diseases[result.code]['symptoms'].get(code, 0)
                 user_severity = selected_symptoms.get(code, "tidak_parah")
                 multiplier = self.severity_multipliers.get(user_severity, 0.5)
                 cf_final = base_cf * multiplier
@@ -761,8 +3106,8 @@ class EarDiagnosisSystem:
                 diagnosis_text += f"  - **CF Gejala:** {cf_final:.2f} ({level})\n"
 
             cf_values = [
-                self.diseases[result['code']]['symptoms'][code] * self.severity_multipliers.get(selected_symptoms[code], 0.5)
-                for code in result['matching_symptoms']
+                self.diseases[result.code]['symptoms'][code] * self.severity_multipliers.get(selected_symptoms[code], 0.5)
+                for code in result.matching_symptoms
             ]
 
             if cf_values:
@@ -774,10 +3119,10 @@ class EarDiagnosisSystem:
 
                 diagnosis_text += f"\n📊 **Perhitungan CF Gabungan:** {cf_explanation} = **{cf_combined * 100:.1f}%**\n"
 
-            cf = result['confidence']
-            match_ratio = result['match_ratio']
-            severity = result['severity']
-            fired_rules = result.get('fired_rules', [])
+            cf = result.confidence
+            match_ratio = result.match_ratio
+            severity = result.severity
+            fired_rules = result.fired_rules
 
             w_cf = 0.4
             w_match = 0.3
@@ -803,12 +3148,12 @@ class EarDiagnosisSystem:
 
         primary_result = results[0]
         solution_text = f"# 💊 Rekomendasi Penanganan\n\n"
-        solution_text += f"**Untuk diagnosis utama: {primary_result['name']}**\n\n"
-        solution_text += f"{primary_result['solution']}\n\n"
+        solution_text += f"**Untuk diagnosis utama: {primary_result.name}**\n\n"
+        solution_text += f"{primary_result.solution}\n\n"
 
-        if primary_result['severity'] == 'Tinggi':
+        if primary_result.severity == 'Tinggi':
             solution_text += "🚨 **PERHATIAN KHUSUS**: Kondisi ini memerlukan penanganan segera!\n\n"
-        elif primary_result['severity'] == 'Sedang':
+        elif primary_result.severity == 'Sedang':
             solution_text += "⚠️ **PERHATIAN**: Monitor perkembangan gejala dengan seksama.\n\n"
 
         solution_text += "## 📞 Kapan Harus ke Dokter?\n"
@@ -826,6 +3171,133 @@ class EarDiagnosisSystem:
         return selected_text, diagnosis_text, solution_text
 
 
+class KnowledgeBaseRegistry:
+    # Beberapa knowledge base spesialis dalam satu proses: dimuat saat pertama dipakai, dikeluarkan (LRU) bila melebihi anggaran memori
+    file_pattern = re.compile(r"^([a-z0-9_]+)_diagnosis_data\.(?:json|kb)$")
+
+    def __init__(self, data_dir="data", memory_budget_mb=256, pinned=('ear',), stats_backend='local', stats_location=None, **system_kwargs):
+        self.data_dir = data_dir
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.pinned = set(pinned)
+        self.stats_backend = stats_backend
+        self.stats_location = stats_location
+        self.system_kwargs = system_kwargs
+        self.systems = OrderedDict()
+        self.lock = threading.Lock()
+        self.loading_locks = {}
+        # Jumlah request yang sedang memakai tiap sistem; yang dikeluarkan saat masih dipakai baru ditutup setelah dilepas
+        self.users = {}
+        self.retiring = {}
+
+    def available(self):
+        # Knowledge base utama tetap tersedia walau belum ada file (dibuat dari data bawaan saat dimuat)
+        names = set(self.pinned)
+        if os.path.isdir(self.data_dir):
+            for filename in os.listdir(self.data_dir):
+                match = self.file_pattern.match(filename)
+                if match:
+                    names.add(match.group(1))
+        return sorted(names, key=lambda name: (name not in self.pinned, name))
+
+    def checkout(self, name):
+        # Dipanggil dengan self.lock; sistem yang sedang menunggu ditutup dipakai lagi agar tidak ada dua instans untuk file yang sama
+        kb_system = self.systems.get(name) or self.retiring.pop(name, None)
+        if kb_system is None:
+            return None
+        self.systems[name] = kb_system
+        self.systems.move_to_end(name)
+        self.users[kb_system] = self.users.get(kb_system, 0) + 1
+        return kb_system
+
+    def acquire(self, name):
+        with self.lock:
+            kb_system = self.checkout(name)
+            if kb_system is not None:
+                return kb_system
+            if name not in self.available():
+                raise KeyError(f"Knowledge base tidak ditemukan: {name}")
+            loading_lock = self.loading_locks.setdefault(name, threading.Lock())
+
+        # Dimuat di luar kunci registry agar request untuk knowledge base lain tidak ikut menunggu
+        with loading_lock:
+            with self.lock:
+                kb_system = self.checkout(name)
+                if kb_system is not None:
+                    return kb_system
+
+            start_time = time.time()
+            backend = None
+            if self.stats_backend != 'local':
+                backend = STATS_BACKENDS[self.stats_backend](self.stats_location, '' if name == 'ear' else name)
+            kb_system = EarDiagnosisSystem(kb_name=name, data_dir=self.data_dir, stats_backend=backend, **self.system_kwargs)
+            print(f"📚 Knowledge base '{name}' dimuat dalam {time.time() - start_time:.2f} detik "
+                  f"({len(kb_system.diseases)} penyakit, {len(kb_system.symptoms)} gejala)")
+
+            with self.lock:
+                self.systems[name] = kb_system
+                self.users[kb_system] = 1
+                evicted = self.select_evictions(keep=name)
+                closing = []
+                for evicted_name, evicted_system in evicted:
+                    if self.users.get(evicted_system):
+                        self.retiring[evicted_name] = evicted_system
+                    else:
+                        self.users.pop(evicted_system, None)
+                        closing.append(evicted_system)
+            for evicted_name, evicted_system in evicted:
+                print(f"♻️ Knowledge base '{evicted_name}' dikeluarkan dari memori (LRU)")
+            for evicted_system in closing:
+                evicted_system.close()
+            return kb_system
+
+    def release(self, kb_system):
+        with self.lock:
+            self.users[kb_system] -= 1
+            if self.users[kb_system] or self.retiring.get(kb_system.kb_name) is not kb_system:
+                return
+            del self.users[kb_system]
+            del self.retiring[kb_system.kb_name]
+        kb_system.close()
+
+    @contextlib.contextmanager
+    def using(self, name):
+        kb_system = self.acquire(name)
+        try:
+            yield kb_system
+        finally:
+            self.release(kb_system)
+
+    def select_evictions(self, keep):
+        footprints = {name: kb_system.memory_footprint() for name, kb_system in self.systems.items()}
+        total = sum(footprints.values())
+        evicted = []
+        for name in list(self.systems):
+            if total <= self.memory_budget:
+                break
+            if name == keep or name in self.pinned:
+                continue
+            total -= footprints[name]
+            evicted.append((name, self.systems.pop(name)))
+        return evicted
+
+    def loaded(self):
+        with self.lock:
+            return list(self.systems)
+
+
+registry = None
+
+
+@contextlib.contextmanager
+def using_kb_system(kb_name):
+    # Sistem dipegang selama request berjalan agar tidak ditutup oleh eviksi LRU di tengah jalan
+    if registry is None or not kb_name or kb_name == system.kb_name:
+        yield system
+        return
+    with registry.using(kb_name) as kb_system:
+        yield kb_system
+
+
 def create_gradio_interface():
     with gr.Blocks(
         title="Sistem Pakar Diagnosa Penyakit Telinga", 
@@ -859,6 +3331,9 @@ def create_gradio_interface():
             font-size: 11px !important;
             margin: 2px 0 !important;
         }
+        .severity-radio input:disabled + span {
+            opacity: 0.4;
+        }
         """
     ) as demo:
         
@@ -889,125 +3364,44 @@ def create_gradio_interface():
                 ### Pilih semua gejala yang Anda rasakan:
                 """)
                 
-                inputs = []
+                kb_names = registry.available() if registry else [system.kb_name]
+                kb_choice = gr.Dropdown(
+                    choices=kb_names,
+                    value=system.kb_name,
+                    label="📚 Knowledge Base Spesialis",
+                    visible=len(kb_names) > 1
+                )
                 
-                with gr.Row():
-                    with gr.Column(scale=1):
-                        gr.Markdown("#### 🔥 Gejala Nyeri & Sensitivitas")
-                        for code in ['G01', 'G02', 'G05', 'G06']:
-                            if code in system.symptoms:
-                                with gr.Row():
-                                    with gr.Column(scale=3):
-                                        symptom_check = gr.Checkbox(
-                                            label=f"{code}: {system.symptoms[code]}",
-                                            value=False,
-                                            elem_classes="symptom-checkbox"
-                                        )
-                                    with gr.Column(scale=1):
-                                        severity_radio = gr.Radio(
-                                            choices=["tidak_parah", "lumayan_parah", "parah", "sangat_parah"],
-                                            value="tidak_parah",
-                                            label="Tingkat:",
-                                            elem_classes="severity-radio",
-                                            interactive=False 
-                                        )
-                                
-                                symptom_check.change(
-                                    fn=lambda checked: gr.update(interactive=checked),
-                                    inputs=[symptom_check],
-                                    outputs=[severity_radio]
-                                )
-                                
-                                inputs.append(symptom_check)
-                                inputs.append(severity_radio)
+                @gr.render(inputs=[kb_choice])
+                def render_symptom_form(kb_name):
+                    with using_kb_system(kb_name) as kb_system:
+                        form_layout = kb_system.get_form_layout()
                     
-                    with gr.Column(scale=1):
-                        gr.Markdown("#### 👂 Masalah Pendengaran & Telinga")
-                        for code in ['G08', 'G09', 'G11', 'G12']:
-                            if code in system.symptoms:
-                                with gr.Row():
-                                    with gr.Column(scale=3):
-                                        symptom_check = gr.Checkbox(
-                                            label=f"{code}: {system.symptoms[code]}",
-                                            value=False,
-                                            elem_classes="symptom-checkbox"
-                                        )
-                                    with gr.Column(scale=1):
-                                        severity_radio = gr.Radio(
-                                            choices=["tidak_parah", "lumayan_parah", "parah", "sangat_parah"],
-                                            value="tidak_parah",
-                                            label="Tingkat:",
-                                            elem_classes="severity-radio",
-                                            interactive=False 
-                                        )
-                                
-                                symptom_check.change(
-                                    fn=lambda checked: gr.update(interactive=checked),
-                                    inputs=[symptom_check],
-                                    outputs=[severity_radio]
-                                )
-                                
-                                inputs.append(symptom_check)
-                                inputs.append(severity_radio)
+                    for row_start in range(0, len(form_layout), 2):
+                        with gr.Row():
+                            for title, codes in form_layout[row_start:row_start + 2]:
+                                with gr.Column(scale=1):
+                                    gr.Markdown(f"#### {title}")
+                                    for code in codes:
+                                        with gr.Row():
+                                            with gr.Column(scale=3):
+                                                gr.Checkbox(
+                                                    label=f"{code}: {kb_system.symptoms[code]}",
+                                                    value=False,
+                                                    elem_id=f"symptom-{code}",
+                                                    elem_classes="symptom-checkbox"
+                                                )
+                                            with gr.Column(scale=1):
+                                                gr.Radio(
+                                                    choices=list(kb_system.severity_multipliers.keys()),
+                                                    value="tidak_parah",
+                                                    label="Tingkat:",
+                                                    elem_id=f"severity-{code}",
+                                                    elem_classes="severity-radio"
+                                                )
                 
-                with gr.Row():
-                    with gr.Column(scale=1):
-                        gr.Markdown("#### 💧 Cairan & Infeksi")
-                        for code in ['G03', 'G04', 'G07']:
-                            if code in system.symptoms:
-                                with gr.Row():
-                                    with gr.Column(scale=3):
-                                        symptom_check = gr.Checkbox(
-                                            label=f"{code}: {system.symptoms[code]}",
-                                            value=False,
-                                            elem_classes="symptom-checkbox"
-                                        )
-                                    with gr.Column(scale=1):
-                                        severity_radio = gr.Radio(
-                                            choices=["tidak_parah", "lumayan_parah", "parah", "sangat_parah"],
-                                            value="tidak_parah",
-                                            label="Tingkat:",
-                                            elem_classes="severity-radio",
-                                            interactive=False 
-                                        )
-                                
-                                symptom_check.change(
-                                    fn=lambda checked: gr.update(interactive=checked), 
-                                    inputs=[symptom_check],
-                                    outputs=[severity_radio]
-                                )
-                                                                
-                                inputs.append(symptom_check)
-                                inputs.append(severity_radio)
-                    
-                    with gr.Column(scale=1):
-                        gr.Markdown("#### ⚖️ Keseimbangan & Sistem")
-                        for code in ['G10']:
-                            if code in system.symptoms:
-                                with gr.Row():
-                                    with gr.Column(scale=3):
-                                        symptom_check = gr.Checkbox(
-                                            label=f"{code}: {system.symptoms[code]}",
-                                            value=False,
-                                            elem_classes="symptom-checkbox"
-                                        )
-                                    with gr.Column(scale=1):
-                                        severity_radio = gr.Radio(
-                                            choices=["tidak_parah", "lumayan_parah", "parah", "sangat_parah"],
-                                            value="tidak_parah",
-                                            label="Tingkat:",
-                                            elem_classes="severity-radio",
-                                            interactive=False 
-                                        )
-                                
-                                symptom_check.change(
-                                    fn=lambda checked: gr.update(interactive=checked), 
-                                    inputs=[symptom_check],
-                                    outputs=[severity_radio]
-                                )
-                                
-                                inputs.append(symptom_check)
-                                inputs.append(severity_radio)
+                # Seluruh form dikirim sebagai satu payload JSON yang diisi oleh FORM_PAYLOAD_JS
+                symptom_payload = gr.Textbox(visible=False)
                 
                 with gr.Row():
                     process_btn = gr.Button(
@@ -1046,44 +3440,860 @@ def create_gradio_interface():
                         elem_classes="result-box"
                     )
                 
+                with gr.Accordion("🎯 Verifikasi Hipotesis (Backward Chaining)", open=False):
+                    gr.Markdown("Pilih satu penyakit yang dicurigai untuk mengecek apakah gejala yang dipilih mendukungnya, tanpa menganalisis semua penyakit.")
+                    with gr.Row():
+                        hypothesis_choice = gr.Dropdown(
+                            choices=[f"{code}: {disease['name']}" for code, disease in system.diseases.items()],
+                            label="Penyakit yang dicurigai",
+                            scale=3
+                        )
+                        hypothesis_btn = gr.Button("🔎 Verifikasi", variant="secondary", scale=1)
+                    hypothesis_output = gr.Markdown(elem_classes="result-box")
+
+                with gr.Accordion("✍️ Ceritakan Gejala Anda", open=False):
+                    gr.Markdown("Tulis keluhan dengan kata-kata sendiri, misalnya *\"telinga berdenging dan agak demam, kepala berputar\"*. Kata seperti *sedikit*, *lumayan*, *parah*, *sangat* menentukan tingkat keparahan.")
+                    with gr.Row():
+                        free_text_input = gr.Textbox(label="Keluhan", placeholder="Contoh: kuping gatal sekali, keluar cairan berbau", scale=3)
+                        free_text_btn = gr.Button("🔍 Cari & Diagnosa", variant="secondary", scale=1)
+
+                with gr.Accordion("🔬 Analisis What-If", open=False):
+                    gr.Markdown("Lihat gejala mana yang paling mengubah hasil jika ditambahkan, dihapus, atau diubah tingkat keparahannya.")
+                    what_if_btn = gr.Button("📈 Hitung Sensitivitas", variant="secondary")
+                    what_if_output = gr.Markdown(elem_classes="result-box")
+
+                def process_diagnosis(kb_name, payload):
+                    with using_kb_system(kb_name) as kb_system:
+                        return kb_system.process_diagnosis(payload)
+
+                def process_free_text(kb_name, text):
+                    with using_kb_system(kb_name) as kb_system:
+                        return kb_system.process_free_text(text)
+
+                def process_what_if(kb_name, payload):
+                    with using_kb_system(kb_name) as kb_system:
+                        return kb_system.process_what_if(payload)
+
+                def process_hypothesis(kb_name, disease_choice, payload):
+                    with using_kb_system(kb_name) as kb_system:
+                        return kb_system.process_hypothesis(disease_choice, payload)
+
+                def reset_outputs(kb_name):
+                    with using_kb_system(kb_name) as kb_system:
+                        return "", "", "", kb_system.get_consultation_stats()
+
+                def switch_knowledge_base(kb_name):
+                    with using_kb_system(kb_name) as kb_system:
+                        choices = [f"{code}: {disease['name']}" for code, disease in kb_system.diseases.items()]
+                        return gr.update(choices=choices, value=None), "", "", "", "", kb_system.get_consultation_stats()
+
+                clear_btn.click(
+                    fn=reset_outputs,
+                    inputs=[kb_choice],
+                    outputs=[selected_output, diagnosis_output, solution_output, stats_output],
+                    js=FORM_RESET_JS
+                )
+
+                kb_choice.change(
+                    fn=switch_knowledge_base,
+                    inputs=[kb_choice],
+                    outputs=[hypothesis_choice, hypothesis_output, selected_output, diagnosis_output, solution_output, stats_output]
+                )
+
                 process_btn.click(
-                    fn=system.process_diagnosis,
-                    inputs=inputs,
+                    fn=process_diagnosis,
+                    inputs=[kb_choice, symptom_payload],
+                    outputs=[selected_output, diagnosis_output, solution_output, stats_output],
+                    js=FORM_PAYLOAD_JS
+                )
+
+                free_text_btn.click(
+                    fn=process_free_text,
+                    inputs=[kb_choice, free_text_input],
                     outputs=[selected_output, diagnosis_output, solution_output, stats_output]
                 )
-                
-                def clear_all():
-                    clear_values = []
-                    for i in range(len(inputs)):
-                        if i % 2 == 0: 
-                            clear_values.append(False)
-                        else: 
-                            clear_values.append("tidak_parah")
-                    
-                    return clear_values + ["", "", "", system.get_consultation_stats()]
-                
-                clear_btn.click(
-                    fn=clear_all,
-                    outputs=inputs + [selected_output, diagnosis_output, solution_output, stats_output]
+
+                what_if_btn.click(
+                    fn=process_what_if,
+                    inputs=[kb_choice, symptom_payload],
+                    outputs=[what_if_output],
+                    js=FORM_PAYLOAD_JS
+                )
+
+                hypothesis_btn.click(
+                    fn=process_hypothesis,
+                    inputs=[kb_choice, hypothesis_choice, symptom_payload],
+                    outputs=[hypothesis_output],
+                    js=FORM_PAYLOAD_JS
+                )
+
+                demo.load(fn=None, js=FORM_TOGGLE_JS)
+
+            with gr.TabItem("🧭 Konsultasi Adaptif", elem_classes="tab-content"):
+                gr.Markdown("""
+                ## Konsultasi Tanya-Jawab
+                Sistem akan menanyakan satu gejala setiap kali, memilih gejala yang paling membantu membedakan penyakit.
+                Jawab **tidak** jika Anda tidak mengalaminya, atau pilih tingkat keparahannya.
+                """)
+
+                adaptive_session = gr.State(None)
+                adaptive_question = gr.Markdown(elem_classes="result-box")
+                adaptive_answer = gr.Radio(
+                    choices=["tidak", "tidak_parah", "lumayan_parah", "parah", "sangat_parah"],
+                    value="tidak",
+                    label="Jawaban Anda:"
+                )
+                with gr.Row():
+                    adaptive_answer_btn = gr.Button("➡️ Jawab", variant="primary", scale=2)
+                    adaptive_restart_btn = gr.Button("🔄 Mulai Baru", variant="secondary", scale=1)
+                adaptive_result = gr.Markdown(elem_classes="result-box")
+
+                def process_adaptive_step(kb_name, answer, session):
+                    with using_kb_system(kb_name) as kb_system:
+                        return kb_system.process_adaptive_step(answer, session)
+
+                def restart_adaptive_session(kb_name):
+                    with using_kb_system(kb_name) as kb_system:
+                        return kb_system.process_adaptive_step("__mulai__", None)
+
+                adaptive_answer_btn.click(
+                    fn=process_adaptive_step,
+                    inputs=[kb_choice, adaptive_answer, adaptive_session],
+                    outputs=[adaptive_question, adaptive_session, adaptive_result]
+                )
+                adaptive_restart_btn.click(
+                    fn=restart_adaptive_session,
+                    inputs=[kb_choice],
+                    outputs=[adaptive_question, adaptive_session, adaptive_result]
+                )
+                kb_choice.change(
+                    fn=restart_adaptive_session,
+                    inputs=[kb_choice],
+                    outputs=[adaptive_question, adaptive_session, adaptive_result]
+                )
+                demo.load(
+                    fn=restart_adaptive_session,
+                    inputs=[kb_choice],
+                    outputs=[adaptive_question, adaptive_session, adaptive_result]
                 )
 
     return demo
 
-if __name__ == "__main__":
-    system = EarDiagnosisSystem()
+_batch_system = None
+
+
+def _batch_worker_init(kb_name='ear'):
+    global _batch_system
+    _batch_system = EarDiagnosisSystem(verbose=False, kb_name=kb_name)
+
+
+def _batch_score_chunk(records):
+    return _batch_system.score_batch_records(records)
+
+
+def read_intake_chunks(input_path, chunksize):
+    if input_path.endswith(('.jsonl', '.ndjson', '.json')):
+        reader = pd.read_json(input_path, lines=True, chunksize=chunksize, dtype=False)
+    else:
+        reader = pd.read_csv(input_path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+    row_offset = 0
+    for chunk in reader:
+        records = list(zip(range(row_offset, row_offset + len(chunk)), chunk.to_dict('records')))
+        row_offset += len(chunk)
+        yield records
+
+
+def write_scored_rows(output, scored, csv_writer=None):
+    for row in scored:
+        if csv_writer is not None:
+            if not row['diagnoses']:
+                csv_writer.writerow([row['id'], 0, "", "", ""])
+            for diagnosis in row['diagnoses']:
+                csv_writer.writerow([row['id'], diagnosis['rank'], diagnosis['code'], diagnosis['name'], diagnosis['confidence']])
+        else:
+            output.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+
+
+def run_batch_scoring(input_path, output_path, chunksize=5000, workers=1, kb_name='ear'):
+    as_csv = output_path.endswith('.csv')
+    total_rows = 0
+    total_diagnosed = 0
+    start_time = time.time()
+
+    def report(scored):
+        nonlocal total_rows, total_diagnosed
+        write_scored_rows(output, scored, csv_writer)
+        output.flush()
+        total_rows += len(scored)
+        total_diagnosed += sum(1 for row in scored if row['diagnoses'])
+        elapsed = max(time.time() - start_time, 1e-9)
+        print(f"📦 {total_rows:,} baris diproses ({total_rows / elapsed:,.0f} baris/detik)")
+
+    with open(output_path, 'w', encoding='utf-8', newline='') as output:
+        csv_writer = None
+        if as_csv:
+            import csv
+            csv_writer = csv.writer(output)
+            csv_writer.writerow(["id", "rank", "code", "name", "confidence"])
+
+        chunks = read_intake_chunks(input_path, chunksize)
+
+        if workers <= 1:
+            _batch_worker_init(kb_name)
+            for records in chunks:
+                report(_batch_score_chunk(records))
+        else:
+            import multiprocessing
+            from collections import deque
+
+            # Batasi jumlah chunk yang sedang diproses agar memori tetap terkendali
+            max_pending = workers * 2
+            pending = deque()
+            with multiprocessing.Pool(workers, initializer=_batch_worker_init, initargs=(kb_name,)) as pool:
+                for records in chunks:
+                    pending.append(pool.apply_async(_batch_score_chunk, (records,)))
+                    if len(pending) >= max_pending:
+                        report(pending.popleft().get())
+                while pending:
+                    report(pending.popleft().get())
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    print("=" * 60)
+    print(f"✅ Selesai: {total_rows:,} konsultasi, {total_diagnosed:,} dengan diagnosis")
+    print(f"⏱️ Waktu: {elapsed:.2f} detik ({total_rows / elapsed:,.0f} konsultasi/detik, {workers} proses)")
+    print(f"💾 Hasil: {output_path}")
+
+    return total_rows
+
+
+def compile_knowledge_base(output_path=None, kb_name='ear'):
+    kb_system = EarDiagnosisSystem(verbose=False, kb_name=kb_name)
+    output_path = output_path or kb_system.compiled_file
+
+    start_time = time.time()
+    size = CompiledKnowledgeBase.compile(
+        kb_system.diseases, kb_system.symptoms, kb_system.inference_rules,
+        output_path, source_path=kb_system.data_file,
+        severity_multipliers=kb_system.severity_multipliers, vocabulary=kb_system.vocabulary_data()
+    )
+    compile_time = time.time() - start_time
+
+    start_time = time.time()
+    compiled_kb = CompiledKnowledgeBase.open(output_path)
+    open_time = time.time() - start_time
+
+    # Waktu muat sebenarnya: load_compiled_data tetap mendekode seluruh isi menjadi dict Python
+    start_time = time.time()
+    compiled_kb.to_dicts()
+    compiled_kb.vocabulary()
+    decode_time = time.time() - start_time
+
+    print(f"✅ Knowledge base dikompilasi: {output_path} ({size:,} byte)")
+    print(f"📊 {compiled_kb.n_diseases} penyakit, {compiled_kb.n_symptoms} gejala, {compiled_kb.nnz} bobot CF, {compiled_kb.n_rules} aturan, {compiled_kb.n_strings} string unik")
+    print(f"⏱️ Kompilasi: {compile_time * 1000:.2f} ms, buka (mmap): {open_time * 1000:.3f} ms, dekode ke dict: {decode_time * 1000:.2f} ms")
+    print(kb_system.get_rule_report())
+
+
+def score_cf_candidates(onehot, labels, rows, cols, shape, candidates):
+    # candidates: C × (bobot CF untuk setiap pasangan penyakit-gejala + pengali keparahan)
+    nnz = len(rows)
+    weights = np.zeros((len(candidates),) + shape)
+    weights[:, rows, cols] = candidates[:, :nnz]
+    multipliers = candidates[:, nnz:]
+
+    # log(1 - cf) per penyakit × gejala × tingkat keparahan; CF gabungan = 1 - exp(Σ log(1 - cf))
+    terms = np.log1p(-np.minimum(weights[..., None] * multipliers[:, None, None, :], 1.0 - 1e-9))
+    cf = 1.0 - np.exp(np.einsum('cdsk,nsk->cnd', terms, onehot))
+
+    best = cf.argmax(axis=2)
+    best_cf = cf.max(axis=2)
+    predicted = np.where(best_cf >= 0.4, best, -1)
+    accuracy = (predicted == labels).mean(axis=1)
+
+    label_cf = np.take_along_axis(cf, np.maximum(labels, 0)[None, :, None], axis=2)[..., 0]
+    rank = 1 + (cf > label_cf[..., None]).sum(axis=2)
+    reciprocal_rank = np.where(labels >= 0, 1.0 / rank, best_cf < 0.4)
+    return accuracy, reciprocal_rank.mean(axis=1)
+
+
+_calibration_data = None
+
+
+def _calibration_worker_init(onehot, labels, rows, cols, shape):
+    global _calibration_data
+    _calibration_data = (onehot, labels, rows, cols, shape)
+
+
+def _calibration_score_batch(candidates):
+    onehot, labels, rows, cols, shape = _calibration_data
+    accuracy = []
+    mrr = []
+    # Batch kecil agar tensor C × D × S × K tetap muat di cache/memori
+    for start in range(0, len(candidates), 16):
+        batch_accuracy, batch_mrr = score_cf_candidates(onehot, labels, rows, cols, shape, candidates[start:start + 16])
+        accuracy.append(batch_accuracy)
+        mrr.append(batch_mrr)
+    if not accuracy:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(accuracy), np.concatenate(mrr)
+
+
+def read_labeled_consultations(input_path):
+    records = []
+    for chunk in read_intake_chunks(input_path, 5000):
+        records.extend(record for _, record in chunk)
+    return records
+
+
+def run_calibration(input_path, output_path, generations=20, population=256, workers=None,
+                    holdout=0.2, seed=42, label_column='diagnosis', kb_name='ear'):
+    import multiprocessing
+
+    workers = workers or os.cpu_count() or 1
+    start_time = time.time()
+
+    cal_system = EarDiagnosisSystem(verbose=False, kb_name=kb_name)
+    records = read_labeled_consultations(input_path)
+    severities = list(cal_system.severity_multipliers.keys())
+    symptom_index = {code: i for i, code in enumerate(cal_system.matrix_symptom_codes)}
+    disease_index = {code: i for i, code in enumerate(cal_system.matrix_disease_codes)}
+    disease_index.update({cal_system.disease_models[code].name: i for code, i in list(disease_index.items())})
+
+    # Enkode konsultasi sebagai one-hot N × gejala × tingkat keparahan
+    onehot = np.zeros((len(records), len(symptom_index), len(severities)))
+    labels = np.full(len(records), -1)
+    for n, record in enumerate(records):
+        for code, severity in cal_system.parse_batch_record(record).items():
+            if code in symptom_index:
+                onehot[n, symptom_index[code], severities.index(severity)] = 1.0
+        labels[n] = disease_index.get(str(record.get(label_column, '')).strip(), -1)
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(records))
+    split = int(len(records) * (1.0 - holdout))
+    train, test = order[:split], order[split:]
+
+    rows, cols = np.nonzero(cal_system.cf_presence)
+    shape = cal_system.cf_matrix.shape
+    nnz = len(rows)
+    baseline = np.concatenate([
+        cal_system.cf_matrix[rows, cols],
+        [cal_system.severity_multipliers[severity] for severity in severities]
+    ])
+
+    def clip(candidates):
+        candidates[:, :nnz] = np.clip(candidates[:, :nnz], 0.01, 1.0)
+        # Pengali keparahan tetap monoton: tingkat lebih parah tidak boleh berbobot lebih kecil
+        candidates[:, nnz:] = np.sort(np.clip(candidates[:, nnz:], 0.05, 1.0), axis=1)
+        return candidates
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(
+            workers, initializer=_calibration_worker_init,
+            initargs=(onehot[train], labels[train], rows, cols, shape)
+        )
+    else:
+        _calibration_worker_init(onehot[train], labels[train], rows, cols, shape)
+
+    def evaluate(candidates):
+        if pool is None:
+            accuracy, mrr = _calibration_score_batch(candidates)
+        else:
+            # Jangan membuat potongan kosong bila populasi lebih kecil dari jumlah potongan
+            parts = pool.map(_calibration_score_batch, np.array_split(candidates, min(len(candidates), workers * 4)))
+            accuracy = np.concatenate([part[0] for part in parts])
+            mrr = np.concatenate([part[1] for part in parts])
+        return accuracy + 1e-3 * mrr
+
+    evaluated = 0
+    search_start = time.time()
+    try:
+        population = max(population, 2)
+        elite_size = min(max(4, population // 16), population - 1)
+        candidates = clip(baseline + rng.normal(0.0, 0.1, (population, len(baseline))))
+        candidates[0] = baseline
+        best, best_score = baseline, -1.0
+        sigma = 0.1
+
+        for generation in range(generations):
+            scores = evaluate(candidates)
+            evaluated += len(candidates)
+
+            ranking = np.argsort(-scores)
+            if scores[ranking[0]] > best_score:
+                best, best_score = candidates[ranking[0]].copy(), scores[ranking[0]]
+            print(f"🧬 Generasi {generation + 1}/{generations}: akurasi terbaik {best_score:.4f} ({evaluated:,} kandidat)")
+
+            elite = candidates[ranking[:elite_size]]
+            parents = elite[rng.integers(0, elite_size, population - elite_size)]
+            sigma *= 0.9
+            candidates = clip(np.vstack([elite, parents + rng.normal(0.0, sigma, parents.shape)]))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    search_time = time.time() - search_start
+
+    # Tulis knowledge base baru: JSON sumber dengan bobot CF dan pengali keparahan hasil kalibrasi
+    with open(cal_system.data_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for (row, col), value in zip(zip(rows, cols), best[:nnz]):
+        disease_code = cal_system.matrix_disease_codes[row]
+        data['diseases'][disease_code]['symptoms'][cal_system.matrix_symptom_codes[col]] = round(float(value), 3)
+    data['severity_multipliers'] = {severity: round(float(value), 3) for severity, value in zip(severities, best[nnz:])}
+    data['last_updated'] = datetime.now().isoformat()
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+    # Akurasi akhir diukur dengan engine sebenarnya (diagnose), bukan jalur vektor
+    def engine_accuracy(indices, diseases=None, multipliers=None):
+        if diseases is not None:
+            cal_system.diseases = diseases
+            cal_system.severity_multipliers.update(multipliers)
+            cal_system.prepare_scoring_tables()
+        correct = 0
+        for n in indices:
+            selected_symptoms = cal_system.parse_batch_record(records[n])
+            results = cal_system.diagnose(selected_symptoms) if selected_symptoms else []
+            predicted = disease_index[results[0].code] if results else -1
+            correct += predicted == labels[n]
+        return correct / max(len(indices), 1)
+
+    baseline_train, baseline_test = engine_accuracy(train), engine_accuracy(test)
+    calibrated_train = engine_accuracy(train, data['diseases'], data['severity_multipliers'])
+    calibrated_test = engine_accuracy(test)
+
+    report = {
+        'input': input_path,
+        'output': output_path,
+        'consultations': {'train': int(len(train)), 'holdout': int(len(test))},
+        'accuracy': {
+            'baseline': {'train': baseline_train, 'holdout': baseline_test},
+            'calibrated': {'train': calibrated_train, 'holdout': calibrated_test}
+        },
+        'severity_multipliers': data['severity_multipliers'],
+        'search': {
+            'generations': generations,
+            'population': population,
+            'candidates_evaluated': evaluated,
+            'workers': workers,
+            'seconds': round(search_time, 3),
+            'candidates_per_second': round(evaluated / max(search_time, 1e-9), 1),
+            'consultation_scores_per_second': round(evaluated * len(train) * len(rows) / max(search_time, 1e-9))
+        },
+        'total_seconds': round(time.time() - start_time, 3)
+    }
+    with open(output_path + '.report.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("=" * 60)
+    print(f"📊 Akurasi baseline  : latih {baseline_train:.1%}, holdout {baseline_test:.1%}")
+    print(f"🎯 Akurasi kalibrasi : latih {calibrated_train:.1%}, holdout {calibrated_test:.1%}")
+    print(f"⚖️ Pengali keparahan : {data['severity_multipliers']}")
+    print(f"⏱️ {evaluated:,} kandidat dalam {search_time:.2f} detik ({evaluated / max(search_time, 1e-9):,.0f} kandidat/detik, {workers} proses)")
+    print(f"💾 Knowledge base baru: {output_path} (laporan: {output_path}.report.json)")
+
+    return report
+
+
+_verify_engines = None
+
+
+def _verify_worker_init(kb_name='ear'):
+    global _verify_engines
+    optimized = EarDiagnosisSystem(verbose=False, kb_name=kb_name)
+    # Referensi membaca sumber JSON sendiri, agar kesalahan dekode .kb atau prepare_scoring_tables ikut terdeteksi
+    with open(optimized.data_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    severity_multipliers = dict(DEFAULT_SEVERITY_MULTIPLIERS)
+    severity_multipliers.update(data.get('severity_multipliers', {}))
+    reference = ReferenceDiagnosisEngine(
+        data.get('diseases', {}), severity_multipliers, data.get('inference_rules', DEFAULT_INFERENCE_RULES)
+    )
+    _verify_engines = (optimized, reference)
+
+
+def compare_engines(optimized, reference, selected_symptoms, tolerance):
+    reference_results, reference_scores = reference.diagnose(selected_symptoms)
+    optimized_results = optimized.diagnose(selected_symptoms)
+    inferred_facts, _ = optimized.forward_chaining_inference(selected_symptoms)
+    vectorized_baseline = optimized.what_if_analysis(selected_symptoms)['baseline']
+
+    problems = []
+    for row, code in enumerate(optimized.matrix_disease_codes):
+        optimized_cf = optimized.calculate_combined_cf(optimized.disease_models[code].symptoms, selected_symptoms, inferred_facts)
+        reference_cf = reference_scores.get(code, 0.0)
+        if abs(optimized_cf - reference_cf) > tolerance:
+            problems.append(f"CF {code}: referensi {reference_cf:.6f}, teroptimasi {optimized_cf:.6f}")
+        if abs(vectorized_baseline[row] - reference_cf) > tolerance:
+            problems.append(f"CF vektor {code}: referensi {reference_cf:.6f}, what-if {vectorized_baseline[row]:.6f}")
+
+    reference_ranking = [(r['code'], r['confidence'], r['matching_symptoms'], r['fired_rules']) for r in reference_results]
+    optimized_ranking = [(r.code, r.confidence, list(r.matching_symptoms), [rule.id for rule in r.fired_rules]) for r in optimized_results]
+    if reference_ranking != optimized_ranking:
+        problems.append(f"Ranking: referensi {reference_ranking}, teroptimasi {optimized_ranking}")
+
+    return problems
+
+
+def _verify_range(task):
+    optimized, reference = _verify_engines
+    mode, start, stop, seed, tolerance = task
+    states = [None] + list(optimized.severity_multipliers.keys())
+    codes = optimized.matrix_symptom_codes
+    rng = np.random.default_rng(seed)
+
+    checked = 0
+    divergences = []
+    for index in range(start, stop):
+        if mode == 'exhaustive':
+            # Dekode indeks sebagai bilangan basis (jumlah tingkat + 1): satu digit per gejala
+            selected_symptoms = {}
+            value = index
+            for code in codes:
+                value, digit = divmod(value, len(states))
+                if digit:
+                    selected_symptoms[code] = states[digit]
+        else:
+            digits = rng.integers(0, len(states), len(codes))
+            digits[rng.random(len(codes)) < 0.5] = 0
+            selected_symptoms = {code: states[digit] for code, digit in zip(codes, digits) if digit}
+
+        if not selected_symptoms:
+            continue
+        checked += 1
+        problems = compare_engines(optimized, reference, selected_symptoms, tolerance)
+        if problems and len(divergences) < 20:
+            divergences.append({'symptoms': selected_symptoms, 'problems': problems})
+        elif problems:
+            divergences.append(None)
+
+    return checked, divergences
+
+
+def run_verification(samples=100000, max_exhaustive=500000, workers=None, tolerance=1e-9, seed=0, kb_name='ear'):
+    import multiprocessing
+
+    workers = workers or os.cpu_count() or 1
+    verify_system = EarDiagnosisSystem(verbose=False, kb_name=kb_name)
+    states = len(verify_system.severity_multipliers) + 1
+    space = states ** len(verify_system.matrix_symptom_codes)
+
+    if space <= max_exhaustive:
+        mode, total = 'exhaustive', space
+        print(f"🔬 Verifikasi menyeluruh: {total:,} kombinasi gejala × tingkat keparahan")
+    else:
+        mode, total = 'sampled', samples
+        print(f"🔬 Ruang input {space:,} terlalu besar; verifikasi {total:,} sampel acak (seed {seed})")
+
+    step = max(1, -(-total // (workers * 8)))
+    tasks = [(mode, start, min(start + step, total), seed + i, tolerance) for i, start in enumerate(range(0, total, step))]
+
+    start_time = time.time()
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=_verify_worker_init, initargs=(kb_name,)) as pool:
+            outcomes = pool.map(_verify_range, tasks)
+    else:
+        _verify_worker_init(kb_name)
+        outcomes = [_verify_range(task) for task in tasks]
+    elapsed = max(time.time() - start_time, 1e-9)
+
+    checked = sum(outcome[0] for outcome in outcomes)
+    divergences = [divergence for outcome in outcomes for divergence in outcome[1]]
+
+    # Regresi parser teks bebas (termasuk penyangkalan) hanya berlaku untuk kosakata telinga bawaan
+    text_failures = []
+    if kb_name == 'ear':
+        for text, expected_selected, expected_excluded in FREE_TEXT_REGRESSION_CASES:
+            selected_symptoms, _, excluded = verify_system.symptom_text_index.parse_free_text(text)
+            excluded_codes = {code for _, code, _ in excluded}
+            if set(selected_symptoms) != expected_selected or excluded_codes != expected_excluded:
+                text_failures.append((text, sorted(selected_symptoms), sorted(excluded_codes), sorted(expected_selected), sorted(expected_excluded)))
+
+    print("=" * 60)
+    print(f"⏱️ {checked:,} konsultasi dibandingkan dalam {elapsed:.2f} detik ({checked / elapsed:,.0f}/detik, {workers} proses)")
+    if not divergences:
+        print(f"✅ Engine teroptimasi identik dengan referensi (toleransi CF {tolerance})")
+    else:
+        print(f"❌ {len(divergences):,} konsultasi berbeda dari referensi")
+        for divergence in [d for d in divergences if d][:5]:
+            print(f"   Gejala: {divergence['symptoms']}")
+            for problem in divergence['problems']:
+                print(f"      - {problem}")
+
+    if kb_name == 'ear':
+        if not text_failures:
+            print(f"✅ {len(FREE_TEXT_REGRESSION_CASES)} kalimat uji teks bebas dikenali dengan benar")
+        for text, selected, excluded, expected_selected, expected_excluded in text_failures:
+            print(f"❌ Teks \"{text}\": terpilih {selected}, dikecualikan {excluded} (seharusnya {expected_selected}, {expected_excluded})")
+
+    return not divergences and not text_failures
+
+
+def run_durability_benchmark(consultations=2000, threads=8, modes=None, save_interval=5, group_commit_delay=0.005, kb_name='ear'):
+    import random
+    import shutil
+    import tempfile
+
+    modes = modes or list(DURABILITY_MODES)
+    rows = []
+    for mode in modes:
+        bench_dir = tempfile.mkdtemp(prefix="stats-bench-")
+        bench_system = EarDiagnosisSystem(
+            verbose=False, audit=False, kb_name=kb_name, durability_mode=mode, save_interval=save_interval,
+            group_commit_delay=group_commit_delay, stats_file=os.path.join(bench_dir, "consultation_stats.json")
+        )
+        try:
+            rng = random.Random(0)
+            codes = list(bench_system.symptoms.keys())
+            severities = list(bench_system.severity_multipliers.keys())
+            diseases = [disease['name'] for disease in bench_system.diseases.values()]
+            workload = [
+                (rng.choice(diseases), {code: rng.choice(severities) for code in rng.sample(codes, 3)})
+                for _ in range(consultations)
+            ]
+            latencies = []
+            # Setiap mode berjalan minimal satu save_interval agar mode periodic benar-benar menulis
+            deadline = time.perf_counter() + save_interval
+
+            def worker(items):
+                local = []
+                while True:
+                    for disease_name, selected_symptoms in items:
+                        started = time.perf_counter()
+                        bench_system.update_consultation_stats(disease_name, selected_symptoms)
+                        local.append(time.perf_counter() - started)
+                    if time.perf_counter() >= deadline:
+                        break
+                latencies.extend(local)
+
+            pool = [threading.Thread(target=worker, args=(workload[i::threads],)) for i in range(threads)]
+            start_time = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            elapsed = max(time.perf_counter() - start_time, 1e-9)
+            writes = bench_system.stats_writes
+        finally:
+            # Menghentikan thread group-commit dan melepas hook atexit sebelum direktori sementara dihapus
+            bench_system.close()
+            shutil.rmtree(bench_dir, ignore_errors=True)
+
+        latencies.sort()
+        rows.append({
+            'mode': mode,
+            'consultations': len(latencies),
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': latencies[len(latencies) // 2] * 1000,
+            'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            'writes': writes
+        })
+
+    print(f"⏱️ Benchmark durabilitas: minimal {consultations:,} konsultasi dan {save_interval} detik (save_interval) per mode, {threads} thread")
+    print("=" * 71)
+    print(f"{'Mode':<14}{'Konsultasi':>11}{'Konsultasi/detik':>18}{'p50 (ms)':>11}{'p99 (ms)':>11}{'Tulis':>8}")
+    for row in rows:
+        print(f"{row['mode']:<14}{row['consultations']:>11,}{row['throughput']:>18,.0f}{row['p50_ms']:>11.2f}{row['p99_ms']:>11.2f}{row['writes']:>8}")
+    print("=" * 71)
+    for mode in modes:
+        print(f"• {mode}: {DURABILITY_MODES[mode]}")
+    return rows
+
+
+def run_audit_query(kb_name='ear', node_id=None, consultation_id=None, start=None, end=None, limit=100, explain=False):
+    audit_system = EarDiagnosisSystem(verbose=False, kb_name=kb_name, node_id=node_id)
+    store = audit_system.audit_store
+
+    if consultation_id is not None:
+        trace = store.get(consultation_id)
+        if trace is None:
+            print(f"❌ Jejak audit untuk konsultasi #{consultation_id} tidak ditemukan di {store.directory}")
+            return []
+        print(audit_system.explain_trace(trace))
+        return [trace]
+
+    start = datetime.fromisoformat(start) if start else datetime(1970, 1, 2)
+    end = datetime.fromisoformat(end) if end else datetime.now()
+    traces = store.find_range(start, end, limit)
+    print(f"🧾 {len(traces)} jejak audit ({start:%Y-%m-%d %H:%M} s/d {end:%Y-%m-%d %H:%M}) dari {store.count:,} total")
+    for trace in traces:
+        if explain:
+            print(audit_system.explain_trace(trace))
+            print("-" * 60)
+            continue
+        snapshot = store.load_snapshot(trace['kb_version'])
+        if trace['results']:
+            disease, confidence_tenths, _ = trace['results'][0]
+            diagnosis = f"{snapshot['diseases'][snapshot['disease_codes'][disease]]['name']} ({confidence_tenths / 10:.1f}%)"
+        else:
+            diagnosis = "tidak ada diagnosis"
+        symptoms = ", ".join(snapshot['symptom_codes'][symptom] for symptom, _ in trace['inputs'])
+        print(f"#{trace['consultation_id']:<8}{trace['timestamp']:%Y-%m-%d %H:%M:%S}  [{symptoms}] → {diagnosis}")
+    return traces
+
+
+_server_ready = threading.Event()
+
+
+def start_readiness_server(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ReadinessHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/ready'):
+                # 503 selama warm-up agar load balancer belum mengirim trafik
+                status, body = (200, b"ready") if _server_ready.is_set() else (503, b"warming up")
+            elif self.path.startswith('/health'):
+                status, body = 200, b"ok"
+            else:
+                status, body = 404, b"not found"
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    print(f"🩺 Readiness: http://localhost:{port}/ready (503 sampai warm-up selesai)")
+    return server
+
+
+def launch_interface(durability_mode='periodic', save_interval=5, readiness_port=7861, warm_up_limit=32,
+                     stats_backend='local', stats_location=None, node_id=None, kb_name='ear', memory_budget_mb=256):
+    global system, registry
+    if readiness_port:
+        start_readiness_server(readiness_port)
+    # Knowledge base utama selalu dimuat dan tidak pernah dikeluarkan; yang lain dimuat saat pertama dipilih
+    registry = KnowledgeBaseRegistry(
+        memory_budget_mb=memory_budget_mb, pinned=(kb_name,), stats_backend=stats_backend, stats_location=stats_location,
+        durability_mode=durability_mode, save_interval=save_interval, node_id=node_id
+    )
+    system = registry.acquire(kb_name)
     
     print("🚀 Memulai Sistem Pakar Diagnosa Penyakit Telinga...")
     print(f"📊 Database: {len(system.diseases)} penyakit, {len(system.symptoms)} gejala")
-    print(f"📈 Total konsultasi sebelumnya: {system.consultation_count}")
+    print(f"📚 Knowledge base tersedia: {', '.join(registry.available())} (anggaran memori {memory_budget_mb} MB)")
+    consultation_count, _, replicas = system.global_stats()
+    print(f"📈 Total konsultasi sebelumnya: {consultation_count} ({replicas} replika, node {system.node_id})")
+    print(system.get_rule_report(), end="")
+    print(f"💾 Durabilitas statistik: {system.durability_mode} — {DURABILITY_MODES[system.durability_mode]}")
     print("🌐 Server akan berjalan di: http://localhost:7860")
     print("🔗 Link sharing akan tersedia setelah server aktif")
     print("=" * 60)
     
+    system.warm_up(warm_up_limit)
+    
     demo = create_gradio_interface()
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
         share=True,
         show_error=True,
-        quiet=False
-    )
\ No newline at end of file
+        quiet=False,
+        prevent_thread_lock=True
+    )
+    _server_ready.set()
+    print("✅ Server siap menerima konsultasi")
+    demo.block_thread()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sistem Pakar Diagnosa Penyakit Telinga")
+    parser.add_argument("--durability", choices=list(DURABILITY_MODES), default="periodic", help="Kebijakan penyimpanan statistik konsultasi")
+    parser.add_argument("--save-interval", type=float, default=5, help="Interval simpan (detik) untuk mode periodic")
+    parser.add_argument("--readiness-port", type=int, default=7861, help="Port endpoint /ready dan /health (0 = nonaktif)")
+    parser.add_argument("--warm-up", type=int, default=32, help="Jumlah kombinasi gejala tersering yang di-cache saat startup")
+    parser.add_argument("--kb", default="ear", help="Knowledge base utama (data/<kb>_diagnosis_data.json)")
+    parser.add_argument("--kb-memory-mb", type=int, default=256, help="Anggaran memori untuk knowledge base yang dimuat")
+    parser.add_argument("--stats-backend", choices=list(STATS_BACKENDS), default="local", help="Penggabungan statistik antar replika")
+    parser.add_argument("--stats-location", default=None, help="Direktori bersama (shared-dir) atau file database (sqlite)")
+    parser.add_argument("--node-id", default=None, help="ID replika yang stabil antar restart (default: hostname)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch_parser = subparsers.add_parser("batch", help="Skor file intake besar (CSV / JSON-lines) secara streaming")
+    batch_parser.add_argument("input", help="File intake (.csv atau .jsonl)")
+    batch_parser.add_argument("output", help="File hasil (.jsonl atau .csv)")
+    batch_parser.add_argument("--chunksize", type=int, default=5000, help="Jumlah baris per chunk")
+    batch_parser.add_argument("--workers", type=int, default=1, help="Jumlah proses paralel")
+
+    compile_parser = subparsers.add_parser("compile-kb", help="Kompilasi knowledge base JSON menjadi file biner siap-mmap")
+    compile_parser.add_argument("--output", default=None, help="Lokasi file biner (default: data/<kb>_diagnosis_data.kb)")
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="Kalibrasi bobot CF dan pengali keparahan dari konsultasi berlabel")
+    calibrate_parser.add_argument("input", help="Konsultasi berlabel (.csv atau .jsonl) dengan kolom diagnosis")
+    calibrate_parser.add_argument("output", help="File knowledge base JSON hasil kalibrasi")
+    calibrate_parser.add_argument("--generations", type=int, default=20, help="Jumlah generasi pencarian")
+    calibrate_parser.add_argument("--population", type=int, default=256, help="Jumlah kandidat per generasi")
+    calibrate_parser.add_argument("--workers", type=int, default=None, help="Jumlah proses (default: semua core)")
+    calibrate_parser.add_argument("--holdout", type=float, default=0.2, help="Porsi data untuk validasi")
+    calibrate_parser.add_argument("--seed", type=int, default=42, help="Seed acak")
+    calibrate_parser.add_argument("--label-column", default="diagnosis", help="Kolom label (kode atau nama penyakit)")
+
+    verify_parser = subparsers.add_parser("verify", help="Bandingkan engine teroptimasi dengan engine referensi")
+    verify_parser.add_argument("--samples", type=int, default=100000, help="Jumlah sampel jika ruang input terlalu besar")
+    verify_parser.add_argument("--max-exhaustive", type=int, default=500000, help="Batas ruang input untuk enumerasi menyeluruh")
+    verify_parser.add_argument("--workers", type=int, default=None, help="Jumlah proses (default: semua core)")
+    verify_parser.add_argument("--tolerance", type=float, default=1e-9, help="Toleransi selisih CF (persen)")
+    verify_parser.add_argument("--seed", type=int, default=0, help="Seed acak untuk mode sampel")
+
+    bench_parser = subparsers.add_parser("bench-durability", help="Ukur throughput pencatatan statistik per mode durabilitas")
+    bench_parser.add_argument("--consultations", type=int, default=2000, help="Jumlah konsultasi per mode")
+    bench_parser.add_argument("--threads", type=int, default=8, help="Jumlah request paralel")
+    bench_parser.add_argument("--group-commit-delay", type=float, default=0.005, help="Jendela pengumpulan batch (detik)")
+
+    audit_parser = subparsers.add_parser("audit", help="Tampilkan jejak audit konsultasi berdasarkan ID atau rentang waktu")
+    audit_parser.add_argument("--id", type=int, default=None, help="ID konsultasi (penjelasan lengkap)")
+    audit_parser.add_argument("--from", dest="start", default=None, help="Awal rentang waktu (ISO, mis. 2025-01-31T08:00)")
+    audit_parser.add_argument("--to", dest="end", default=None, help="Akhir rentang waktu (ISO, default: sekarang)")
+    audit_parser.add_argument("--limit", type=int, default=100, help="Jumlah jejak maksimum untuk rentang waktu")
+    audit_parser.add_argument("--explain", action="store_true", help="Tampilkan penjelasan lengkap untuk setiap jejak")
+
+    args = parser.parse_args()
+    if args.stats_backend != "local" and not args.stats_location:
+        parser.error("--stats-location wajib diisi untuk backend shared-dir / sqlite")
+    # Knowledge base yang tidak ada akan dibuat dari data bawaan telinga, jadi salah ketik harus ditolak
+    kb_names = KnowledgeBaseRegistry().available()
+    if args.kb not in kb_names:
+        parser.error(f"knowledge base tidak ditemukan: {args.kb} (tersedia: {', '.join(kb_names)})")
+
+    if args.command == "batch":
+        run_batch_scoring(args.input, args.output, chunksize=args.chunksize, workers=args.workers, kb_name=args.kb)
+    elif args.command == "compile-kb":
+        compile_knowledge_base(args.output, kb_name=args.kb)
+    elif args.command == "calibrate":
+        run_calibration(
+            args.input, args.output, generations=args.generations, population=args.population,
+            workers=args.workers, holdout=args.holdout, seed=args.seed, label_column=args.label_column, kb_name=args.kb
+        )
+    elif args.command == "verify":
+        passed = run_verification(
+            samples=args.samples, max_exhaustive=args.max_exhaustive, workers=args.workers,
+            tolerance=args.tolerance, seed=args.seed, kb_name=args.kb
+        )
+        sys.exit(0 if passed else 1)
+    elif args.command == "bench-durability":
+        run_durability_benchmark(
+            consultations=args.consultations, threads=args.threads,
+            save_interval=args.save_interval, group_commit_delay=args.group_commit_delay, kb_name=args.kb
+        )
+    elif args.command == "audit":
+        run_audit_query(
+            kb_name=args.kb, node_id=args.node_id, consultation_id=args.id,
+            start=args.start, end=args.end, limit=args.limit, explain=args.explain
+        )
+    else:
+        launch_interface(
+            durability_mode=args.durability, save_interval=args.save_interval,
+            readiness_port=args.readiness_port, warm_up_limit=args.warm_up,
+            stats_backend=args.stats_backend, stats_location=args.stats_location, node_id=args.node_id,
+            kb_name=args.kb, memory_budget_mb=args.kb_memory_mb
+        )